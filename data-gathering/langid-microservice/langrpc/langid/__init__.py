@@ -4,8 +4,15 @@ import re
 from os import path
 from typing import List
 
-with open(path.join(path.dirname(path.realpath(__file__)), "model.pickle"), 'br') as f:
-    pipe = pickle.load(f)
+_dir = path.dirname(path.realpath(__file__))
+
+if path.exists(path.join(_dir, "model.artifact", "meta.json")):
+    # memory-mapped: shared by all the server processes (see artifact.py)
+    from .artifact import load_artifact
+    pipe = load_artifact(path.join(_dir, "model.artifact"))
+else:
+    with open(path.join(_dir, "model.pickle"), 'br') as f:
+        pipe = pickle.load(f)
 
 LABELS = ['de', 'fr', 'en', 'it', 'sg']
 
@@ -10,8 +10,8 @@ VERSION_NUMBER = 1
 VERSION_DESCRIPTION = "TfidfVectorizer_ngrams3-5_f6000_logreg"
 LABELS = ['de', 'fr', 'en', 'it', 'sg']
 
-with open(path.join(path.dirname(path.realpath(__file__)), _model_file), 'br') as f:
-    pipe = pickle.load(f)
+# loaded once by the package (model.artifact if exported, _model_file otherwise)
+from . import pipe
 
 rr = re.compile("[^\w \.,]|\d|_")
 def sanitize(txt: str) -> str:
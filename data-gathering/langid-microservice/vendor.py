@@ -0,0 +1,49 @@
+"""
+Copy the modules shared with the webapp into the Docker build context (this folder), or check that
+the copies are up to date. The webapp holds the reference: the artifact format is defined by
+../../language-detection-webapp/langid/artifact.py, which exports the artifacts loaded here.
+
+Usage (from the folder of this file):
+
+    python vendor.py            # copy the modules, before building the image
+    python vendor.py --check    # exit with an error if a copy differs from the webapp's module
+"""
+import argparse
+import filecmp
+import shutil
+import sys
+from os import path
+
+_here = path.dirname(path.realpath(__file__))
+_webapp = path.join(_here, '..', '..', 'language-detection-webapp')
+
+# the vendored modules: copy => source
+VENDORED = {
+    path.join('langrpc', 'langid', 'artifact.py'): path.join('langid', 'artifact.py'),
+}
+
+
+def outdated() -> list:
+    """ :return: the vendored modules that differ from (or are missing from) the webapp's module. """
+    return [copy for (copy, source) in VENDORED.items()
+            if not path.exists(path.join(_here, copy))
+            or not filecmp.cmp(path.join(_webapp, source), path.join(_here, copy), shallow=False)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the modules shared with the webapp into the microservice.")
+    parser.add_argument('--check', action='store_true', help="Only check that the copies are up to date.")
+    args = parser.parse_args()
+
+    stale = outdated()
+    if args.check:
+        for copy in stale:
+            print("%s differs from %s: run python vendor.py" % (copy, path.relpath(path.join(_webapp, VENDORED[copy]))))
+        sys.exit(1 if stale else 0)
+    for copy in stale:
+        shutil.copyfile(path.join(_webapp, VENDORED[copy]), path.join(_here, copy))
+        print("updated %s" % copy)
+
+
+if __name__ == "__main__":
+    main()
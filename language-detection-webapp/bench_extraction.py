@@ -0,0 +1,134 @@
+import glob
+import io
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from os import path
+
+import click
+
+from langid import blocks, extraction
+
+_fixtures_dir = path.join(path.dirname(path.realpath(__file__)), 'fixtures', 'html')
+_recorded_dir = path.join(path.dirname(path.realpath(__file__)), 'fixtures', 'boilerpipe')
+
+
+def load_fixtures(folder):
+    """ :return: the html pages of :param folder: (*.html), by file name. """
+    return dict((path.basename(f), io.open(f, encoding='utf-8').read())
+                for f in sorted(glob.glob(path.join(folder, '*.html'))))
+
+
+def load_recorded(folder):
+    """
+    :return: the text blocks extracted by boilerpipe from the pages, by file name of the page (foo.html)
+        then by extractor name, read from the files of :param folder: (foo.json, see save_fixture).
+    """
+    recorded = dict()
+    for fpath in sorted(glob.glob(path.join(folder, '*.json'))):
+        with io.open(fpath, encoding='utf-8') as f:
+            recorded[path.splitext(path.basename(fpath))[0] + '.html'] = json.load(f)['extractors']
+    return recorded
+
+
+def save_fixture(url, folder, recorded_folder):
+    """
+    Fetch :param url: and save it in :param folder:, named after the url. If boilerpipe is installed,
+    also record the text blocks it extracts from the url with each extractor in :param recorded_folder:
+    (the page is downloaded again by boilerpipe: it should not change in the meantime).
+    :return: the name of the page.
+    """
+    from langid.fetching import fetcher
+    name = re.sub(r"[^\w.-]+", '_', re.sub(r"^https?://", '', url)).strip('_')[:100] + '.html'
+    with io.open(path.join(folder, name), 'w', encoding='utf-8') as f:
+        f.write(fetcher.fetch(url))
+    if extraction.Extractor is not None:
+        os.makedirs(recorded_folder, exist_ok=True)
+        extractors = dict((e, extraction.text_blocks(url, e, 'boilerpipe')) for e in blocks.EXTRACTORS)
+        with io.open(path.join(recorded_folder, path.splitext(name)[0] + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(url=url, extractors=extractors), f, ensure_ascii=False, indent=1, sort_keys=True)
+    return name
+
+
+def compare_recorded(pages, recorded, extractor_name) -> dict:
+    """
+    :return: the agreement (see agreement) of the python backend with the blocks recorded from boilerpipe,
+        for each of the :param pages: having recorded blocks for :param extractor_name:, by page name.
+    """
+    return dict((page, agreement(recorded[page][extractor_name],
+                                 extraction.extract_blocks(pages[page], extractor_name)))
+                for page in sorted(pages) if extractor_name in recorded.get(page, {}))
+
+
+def agreement(reference, other) -> dict:
+    """
+    :return: the agreement between two lists of text blocks: the fraction of identical blocks
+        and the F1 score of their lines (the sentences predicted by the webapp).
+    """
+    (ref_blocks, blocks) = (Counter(reference), Counter(other))
+    same_blocks = sum((ref_blocks & blocks).values())
+    (ref_lines, lines) = (_lines(reference), _lines(other))
+    same_lines = sum((ref_lines & lines).values())
+    n_blocks = max(sum(ref_blocks.values()), sum(blocks.values()))
+    n_lines = sum(ref_lines.values()) + sum(lines.values())
+    return dict(blocks=same_blocks / n_blocks if n_blocks else 1.0,
+                lines=2 * same_lines / n_lines if n_lines else 1.0)
+
+
+def _lines(text_blocks):
+    return Counter(line.strip() for block in text_blocks for line in block.split('\n') if line.strip())
+
+
+def timed(func, pages, repeat):
+    """ :return: a tuple (results, ms per page) with the results of func(html) for each page. """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = dict((name, func(html)) for (name, html) in pages.items())
+    return results, (time.perf_counter() - start) * 1000 / (repeat * max(len(pages), 1))
+
+
+@click.command()
+@click.option('--fixtures', '-f', default=_fixtures_dir, type=click.Path(file_okay=False),
+              help="Folder of the html fixtures (*.html).")
+@click.option('--recorded', default=_recorded_dir, type=click.Path(file_okay=False),
+              help="Folder of the blocks recorded from boilerpipe (*.json).")
+@click.option('--extractor', '-e', 'extractors', multiple=True, type=click.Choice(list(blocks.EXTRACTORS)),
+              help="Extractor to benchmark (repeatable), all by default.")
+@click.option('--repeat', '-r', default=5, type=int, help="Number of runs over the fixtures.")
+@click.option('--save', '-s', 'urls', multiple=True,
+              help="Fetch this url into the fixtures first, recording boilerpipe's blocks if installed (repeatable).")
+@click.option('--verbose', '-v', default=False, is_flag=True, help="Show the agreement of each page.")
+def run(fixtures, recorded, extractors, repeat, urls, verbose):
+    """
+    Measure the speed of the python extraction backend on saved pages, and its agreement with the
+    blocks recorded from boilerpipe for these pages (if any).
+    """
+    for url in urls:
+        print("saved %s" % save_fixture(url, fixtures, recorded))
+    pages = load_fixtures(fixtures)
+    if not pages:
+        print("no fixtures in %s" % fixtures)
+        sys.exit(1)
+    recorded_blocks = load_recorded(recorded)
+    print("%d pages, %d kB, %d with blocks recorded from boilerpipe" % (
+        len(pages), sum(map(len, pages.values())) // 1024, len(set(pages) & set(recorded_blocks))))
+
+    for name in extractors or list(blocks.EXTRACTORS):
+        (python, python_ms) = timed(lambda html: extraction.extract_blocks(html, name), pages, repeat)
+        line = "%-26s python %7.2f ms/page %5.1f blocks/page" % (
+            name, python_ms, sum(map(len, python.values())) / len(pages))
+        scores = compare_recorded(pages, recorded_blocks, name)
+        if scores:
+            line += "  agreement with boilerpipe: blocks %.3f lines %.3f" % (
+                sum(s['blocks'] for s in scores.values()) / len(scores),
+                sum(s['lines'] for s in scores.values()) / len(scores))
+        print(line)
+        if verbose:
+            for (page, score) in scores.items():
+                print("    %-40s blocks %.3f lines %.3f" % (page, score['blocks'], score['lines']))
+
+if __name__ == "__main__":
+    run()
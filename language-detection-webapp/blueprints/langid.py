@@ -2,13 +2,15 @@ import logging
 
 from flask import Blueprint
 
-from flask import Flask, render_template, request, flash
+from flask import Flask, render_template, request, flash, jsonify
 from flask_wtf import FlaskForm
 from wtforms import StringField, validators, SelectField, BooleanField
 from wtforms.fields.html5 import IntegerRangeField
 from wtforms.widgets import TextArea
 
 import langid
+from langid.fetching import fetcher
+from langid.models import models as registry
 from utils.utils import templated
 
 blueprint_langid = Blueprint('langid', __name__)
@@ -95,3 +97,9 @@ def predict_text():
     results = [[r] for r in langid.lang_of_text(
         form.text.data, model=form.model_class.data, with_proba=True)]
     return dict(form=form, results=results, labels=langid.DEFAULT_LABELS)
+
+
+@blueprint_langid.route('/stats')
+def stats():
+    """ The models in memory and the statistics of the prediction cache, batchers and fetcher, as JSON. """
+    return jsonify(dict(registry.report(), fetching=fetcher.report()))
@@ -0,0 +1,49 @@
+import sys
+
+import click
+
+from bench_extraction import _fixtures_dir, _recorded_dir, load_fixtures, load_recorded, compare_recorded
+from langid import blocks
+
+
+@click.command()
+@click.option('--fixtures', '-f', default=_fixtures_dir, type=click.Path(file_okay=False),
+              help="Folder of the html fixtures (*.html).")
+@click.option('--recorded', default=_recorded_dir, type=click.Path(file_okay=False),
+              help="Folder of the blocks recorded from boilerpipe (*.json, see bench_extraction.py --save).")
+@click.option('--tolerance', '-t', default=0.0, type=float,
+              help="Maximal disagreement (fraction of blocks that differ) allowed on each page.")
+def run(fixtures, recorded, tolerance):
+    """
+    Check that the python extraction backend extracts the same blocks as boilerpipe, extractor by extractor,
+    on the pages whose boilerpipe blocks were recorded.
+    """
+    pages = load_fixtures(fixtures)
+    recorded_blocks = load_recorded(recorded)
+    checked = sorted(set(pages) & set(recorded_blocks))
+    if not checked:
+        print("no page with blocks recorded from boilerpipe in %s: record real pages with "
+              "`python bench_extraction.py -s <url>` (boilerpipe must be installed)" % recorded)
+        sys.exit(1)
+    print("%d pages with recorded blocks" % len(checked))
+
+    failed = False
+    for name in blocks.EXTRACTORS:
+        scores = compare_recorded(pages, recorded_blocks, name)
+        if not scores:
+            print("%-26s no recorded blocks" % name)
+            failed = True
+            continue
+        worst = min(scores, key=lambda page: scores[page]['blocks'])
+        ok = scores[worst]['blocks'] >= 1 - tolerance
+        failed |= not ok
+        print("%-26s %d pages  blocks %.3f  lines %.3f  worst %s (blocks %.3f)  %s" % (
+            name, len(scores), sum(s['blocks'] for s in scores.values()) / len(scores),
+            sum(s['lines'] for s in scores.values()) / len(scores), worst, scores[worst]['blocks'],
+            "ok" if ok else "MISMATCH"))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    run()
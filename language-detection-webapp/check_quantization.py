@@ -0,0 +1,67 @@
+import io
+import sys
+from os import path
+
+import click
+
+from langid.compiled import PRECISIONS, evaluate_precisions
+from langid.model import DEFAULT_LABELS
+from langid.models import models
+from langid.sanitization import get_sanitizer
+
+_datadir = path.join(path.dirname(path.realpath(__file__)), '..', 'language-detection', 'data')
+
+
+def _lines(fpath):
+    return [line.strip() for line in io.open(fpath, encoding="utf-8")]
+
+
+def load_datasets(data):
+    """
+    :return: the evaluation sets of the notebooks (see notebook_utils): the held-out validation
+        data (valid_*.txt) and the SMS recall set (sms-sg.txt, Swiss German only).
+    """
+    (X, y) = ([], [])
+    for (i, lang) in enumerate(DEFAULT_LABELS):
+        lines = _lines(path.join(data, 'valid_%s.txt' % lang))
+        X += lines
+        y += [i] * len(lines)
+    sms = _lines(path.join(data, 'sms-sg.txt'))
+    return dict(validation=(X, y), sms_recall=(sms, [DEFAULT_LABELS.index('sg')] * len(sms)))
+
+
+@click.command()
+@click.option('--data', '-d', default=_datadir, help="Folder of the evaluation data (valid_*.txt, sms-sg.txt).")
+@click.option('--model', '-m', 'descriptions', multiple=True, type=click.Choice(models.keys()),
+              help="Model to check (repeatable), all the compiled models of the registry by default.")
+@click.option('--tolerance', '-t', default=0.001, type=float,
+              help="Maximal accuracy loss of a quantized table on each dataset.")
+def run(data, descriptions, tolerance):
+    """
+    Check the accuracy of the quantized (float32, int8) weight tables of the models against the float64 one.
+    """
+    datasets = load_datasets(data)
+    print("datasets: %s" % ", ".join("%s %d texts" % (k, len(v[0])) for (k, v) in datasets.items()))
+
+    failed = False
+    for model in map(models.peek, descriptions or models.keys()):
+        if not model.compiled:
+            continue
+        sanitize = get_sanitizer(model.sanitizer_version)
+        sanitized = dict((name, ([sanitize(x) for x in X], y)) for (name, (X, y)) in datasets.items())
+        results = evaluate_precisions(model.read_pipeline(), sanitized)
+        print("\n%s (serving %s)" % (model.description, model.precision))
+        for precision in PRECISIONS:
+            res = results[precision]
+            losses = [results['float64'][name] - res[name] for name in datasets]
+            ok = all(loss <= tolerance for loss in losses)
+            failed |= not ok
+            print("  %-7s %8d bytes  %s  agreement %.5f  max proba diff %.2e  %s" % (
+                precision, res['nbytes'], "  ".join("%s %.4f" % (name, res[name]) for name in datasets),
+                res['agreement'], res['max_proba_diff'] or 0, "ok" if ok else "REGRESSION"))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,40 @@
+import glob
+import io
+import sys
+from os import path
+
+import click
+
+from langid.sanitization import SANITIZERS, check_sanitizers
+
+_datadir = path.join(path.dirname(path.realpath(__file__)), '..', 'language-detection', 'data')
+
+
+@click.command()
+@click.option('--data', '-d', default=_datadir, help="Folder of the corpora (one sentence per line, *.txt).")
+@click.option('--version', '-v', 'versions', multiple=True, type=click.Choice(list(SANITIZERS.keys())),
+              help="Version to check (repeatable), all by default.")
+@click.option('--timeout', '-t', default=1.0, type=float,
+              help="Skip the texts on which the reference sanitizer takes more than this many seconds.")
+def run(data, versions, timeout):
+    """
+    Check that each compiled sanitizer gives the same output as its reference implementation.
+    """
+    texts = []
+    for fpath in sorted(glob.glob(path.join(data, '*.txt'))):
+        texts += [line.rstrip('\n') for line in io.open(fpath, encoding="utf-8")]
+    print("corpus: %d texts" % len(texts))
+
+    results = check_sanitizers(texts, versions or None, timeout)
+    for (version, res) in results.items():
+        print("%-4s checked %6d  skipped %3d  mismatches %4d  reference %6.2f s  compiled %6.2f s" % (
+            version, res['checked'], res['skipped'], len(res['mismatches']),
+            res['reference_seconds'], res['compiled_seconds']))
+        for (text, expected, actual) in res['mismatches'][:5]:
+            print("    %r\n      expected %r\n      actual   %r" % (text, expected, actual))
+
+    sys.exit(1 if any(res['mismatches'] for res in results.values()) else 0)
+
+
+if __name__ == "__main__":
+    run()
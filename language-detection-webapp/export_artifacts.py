@@ -0,0 +1,44 @@
+import pickle
+import sys
+from os import path
+
+import click
+
+from langid.artifact import export_artifact
+from langid.models import models
+
+
+@click.command()
+@click.option('--model', '-m', 'descriptions', multiple=True, type=click.Choice(models.keys()),
+              help="Model to export (repeatable), all the models of the registry by default.")
+@click.option('--pickle', '-p', 'pickles', multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help="Export this pickle instead (repeatable), next to it: foo.pickle => foo.artifact.")
+@click.option('--sanitizer', '-s', default=None,
+              help="Sanitizer version to record with --pickle (the one saved by save_model by default).")
+def run(descriptions, pickles, sanitizer):
+    """
+    Export pickled pipelines as memory-mapped artifacts (see langid/artifact.py).
+    The webapp loads the artifact of a model instead of its pickle when it exists.
+    """
+    if pickles:
+        jobs = [(fpath, path.splitext(fpath)[0] + '.artifact', sanitizer) for fpath in pickles]
+    else:
+        jobs = [(m.path, m.artifact_path, m.sanitizer_version)
+                for m in map(models.peek, descriptions or models.keys())]
+
+    failed = 0
+    for (fpath, directory, version) in jobs:
+        try:
+            with open(fpath, 'br') as f:
+                pipe = pickle.load(f)
+            export_artifact(pipe, directory, version)
+            print("exported %s => %s" % (path.basename(fpath), directory))
+        except Exception as e:  # e.g. unsupported pipeline, pickle from another sklearn version
+            print("skipped %s: %s" % (path.basename(fpath), e))
+            failed += 1
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,4 +1,7 @@
-from .model import Model, DEFAULT_LABELS
+from .model import Model, DEFAULT_LABELS, save_model
+from .models import ModelRegistry
+from .prediction_cache import PredictionCache
+from .batching import MicroBatcher
 from .langid import *
 
 __all__ = [langid, model]
@@ -0,0 +1,380 @@
+"""
+Memory-mappable model artifacts.
+
+An artifact is a folder holding a served pipeline (vectorizer + linear classifier) without
+pickle:
+ - meta.json: the format version, the sanitizer version and the parameters of the steps;
+ - terms.npy: the vocabulary, as a sorted fixed-width unicode array, and columns.npy: the
+   feature index of each term;
+ - the fitted arrays (idf.npy, coef.npy, ...), as raw numpy arrays.
+
+load_artifact opens the arrays with mmap_mode='r': all the processes serving the same model share
+one copy in the page cache, and loading does not depend on the number of features.
+"""
+import json
+import os
+from collections import defaultdict
+from itertools import chain
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer, TfidfTransformer
+
+FORMAT_VERSION = 1
+
+_META = 'meta.json'
+
+# parameters of the vectorizers needed to rebuild their analyzer
+_ANALYZER_PARAMS = ['input', 'encoding', 'decode_error', 'strip_accents', 'lowercase', 'token_pattern',
+                    'stop_words', 'analyzer', 'ngram_range']
+_TFIDF_PARAMS = ['norm', 'use_idf', 'smooth_idf', 'sublinear_tf']
+
+
+def is_artifact(directory) -> bool:
+    return os.path.exists(os.path.join(directory, _META))
+
+
+def export_artifact(pipe, directory, sanitizer_version=None):
+    """
+    Write the sklearn pipeline :param pipe: as an artifact in :param directory: (created if needed).
+    Supported pipelines: a CountVectorizer or TfidfVectorizer (optionally followed by a TfidfTransformer),
+    then a LogisticRegression, MultinomialNB, LinearSVC or SVC(kernel='linear').
+
+    :param sanitizer_version: the version of the sanitizer, if not recorded by save_model.
+    :raise ValueError: if the pipeline is not supported or records another sanitizer version.
+    """
+    (meta, arrays) = _describe(pipe, sanitizer_version)
+    os.makedirs(directory, exist_ok=True)
+    for (name, array) in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), array)
+    with open(os.path.join(directory, _META), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_artifact(directory) -> 'ArtifactPipeline':
+    """
+    Open an artifact written by export_artifact.
+    :raise ValueError: if the artifact has an unknown format version.
+    """
+    with open(os.path.join(directory, _META)) as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT_VERSION:
+        raise ValueError("%s: unsupported artifact format %r" % (directory, meta.get('format')))
+    arrays = dict((fname[:-len('.npy')], np.load(os.path.join(directory, fname), mmap_mode='r'))
+                  for fname in os.listdir(directory) if fname.endswith('.npy'))
+    return ArtifactPipeline(meta, arrays, directory)
+
+
+def artifact_of(pipe, sanitizer_version=None) -> 'ArtifactPipeline':
+    """
+    :return: the ArtifactPipeline of the sklearn pipeline :param pipe:, in memory (see export_artifact).
+    """
+    return ArtifactPipeline(*_describe(pipe, sanitizer_version))
+
+
+class ArtifactPipeline:
+    """
+    A pipeline loaded from an artifact, with the predict/predict_proba interface of the sklearn
+    pipeline it was exported from. Everything is computed with numpy, from the (memory-mapped) arrays.
+    """
+
+    def __init__(self, meta, arrays, directory=None):
+        """
+        :param meta: the content of meta.json.
+        :param arrays: the arrays of the artifact, by name.
+        :param directory: the folder of the artifact, if loaded from disk.
+        """
+        self.directory = directory
+        self.meta = meta
+        self.arrays = arrays
+        self.sanitizer_version = meta['sanitizer_version']
+
+        vec = meta['vectorizer']
+        params = dict(vec['params'])
+        params['ngram_range'] = tuple(params['ngram_range'])
+        self._analyze = CountVectorizer(**params).build_analyzer()
+        self._terms = arrays['terms']
+        self._columns = arrays['columns']
+        self._dtype = np.dtype(vec['dtype'])
+        self._idf = arrays.get('idf')
+
+        self._kind = meta['classifier']['kind']
+        self.classes_ = arrays['classes']
+        if self._kind == 'multinomial_nb':
+            self._coef = arrays['feature_log_prob']
+            self._intercept = arrays['class_log_prior']
+        else:
+            self._coef = arrays['coef']
+            self._intercept = arrays['intercept']
+        self._probA = arrays.get('probA')
+        self._probB = arrays.get('probB')
+
+    @property
+    def n_features(self) -> int:
+        return self._coef.shape[1]
+
+    def transform(self, texts) -> csr_matrix:
+        """ :return: the document-term matrix of :param texts:, as computed by the exported vectorizer. """
+        vec = self.meta['vectorizer']
+        X = self._count(texts)
+        if vec['binary']:
+            X.data.fill(1)
+        tfidf = vec['tfidf']
+        if tfidf is None:
+            return X.astype(self._dtype) if X.dtype != self._dtype else X
+
+        X = X.astype(np.float64)
+        if tfidf['sublinear_tf']:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self._idf is not None:
+            X.data *= self._idf[X.indices]
+        if tfidf['norm'] is not None:
+            rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+            if tfidf['norm'] == 'l2':
+                norms = np.sqrt(np.bincount(rows, X.data ** 2, minlength=X.shape[0]))
+            else:
+                norms = np.bincount(rows, np.abs(X.data), minlength=X.shape[0])
+            norms[norms == 0] = 1
+            X.data /= norms[rows]
+        # the tf-idf weights are floats, even if the vectorizer counts with an integer dtype
+        return X.astype(self._dtype) if self._dtype.kind == 'f' and self._dtype != np.float64 else X
+
+    def decision_function(self, texts) -> np.ndarray:
+        X = self.transform(texts)
+        return np.asarray(X @ self._coef.T) + self._intercept
+
+    def predict(self, texts) -> np.ndarray:
+        scores = self.decision_function(texts)
+        if self._kind == 'svc':
+            return self.classes_[self._ovo_votes(scores).argmax(axis=1)]
+        if scores.shape[1] == 1:
+            return self.classes_[(scores[:, 0] > 0).astype(np.int64)]
+        return self.classes_[scores.argmax(axis=1)]
+
+    def predict_proba(self, texts) -> np.ndarray:
+        scores = self.decision_function(texts)
+        if self._kind == 'multinomial_nb':
+            return _softmax(scores)
+        if self._kind == 'logistic':
+            if scores.shape[1] == 1:
+                p = _expit(scores[:, 0])
+                return np.column_stack([1 - p, p])
+            if self.meta['classifier']['multi_class'] == 'multinomial':
+                return _softmax(scores)
+            proba = _expit(scores)
+            return proba / proba.sum(axis=1, keepdims=True)
+        if self._kind == 'svc' and self._probA is not None:
+            return self._svc_proba(scores)
+        raise AttributeError("predict_proba is not available for this model (%s)" % self._kind)
+
+    def __repr__(self):
+        return "%s(%r, %s, %d features)" % (type(self).__name__, self.directory, self._kind, self.n_features)
+
+    # -- private methods
+
+    def _count(self, texts) -> csr_matrix:
+        (rows, pos, n_docs) = self._positions(texts)
+        X = csr_matrix((np.ones(pos.size, dtype=np.int64), (rows, self._columns[pos])),
+                       shape=(n_docs, self.n_features))
+        X.sum_duplicates()
+        return X
+
+    def _positions(self, texts):
+        """
+        Analyze :param texts: and look up their terms in the vocabulary.
+        :return: a tuple (rows, pos, n_docs): for each term of the vocabulary found (in document
+            order), its document and its position in the terms table.
+        """
+        docs = [self._analyze(text) for text in texts]
+        lengths = np.fromiter(map(len, docs), dtype=np.int64, count=len(docs))
+        rows = np.repeat(np.arange(len(docs)), lengths)
+
+        # look up each distinct term of the batch only once
+        ids = defaultdict()
+        ids.default_factory = ids.__len__
+        term_ids = np.fromiter(map(ids.__getitem__, chain.from_iterable(docs)), dtype=np.int64, count=rows.size)
+        pos = self._lookup(np.array(list(ids), dtype=str))[term_ids]
+
+        found = pos >= 0
+        return rows[found], pos[found], len(docs)
+
+    def _lookup(self, terms) -> np.ndarray:
+        """ :return: the position of each term in the terms table, -1 for the terms out of the vocabulary. """
+        positions = np.full(terms.size, -1, dtype=np.int64)
+        if terms.size == 0 or self._terms.size == 0:
+            return positions
+        # terms longer than the vocabulary width cannot match (and would be truncated by the cast)
+        fit = np.char.str_len(terms) <= self._terms.dtype.itemsize // 4
+        candidates = terms[fit].astype(self._terms.dtype)
+        pos = np.searchsorted(self._terms, candidates)
+        pos[pos == self._terms.size] = 0
+        found = self._terms[pos] == candidates
+        positions[np.flatnonzero(fit)[found]] = pos[found]
+        return positions
+
+    def _ovo_votes(self, scores):
+        # libsvm's one-vs-one voting: pair (i, j) votes for i if its decision is positive
+        n_classes = self.classes_.size
+        votes = np.zeros((scores.shape[0], n_classes), dtype=np.int64)
+        for (k, (i, j)) in enumerate(_ovo_pairs(n_classes)):
+            positive = self._libsvm_decision(scores[:, k]) > 0
+            votes[:, i] += positive
+            votes[:, j] += ~positive
+        return votes
+
+    def _libsvm_decision(self, scores):
+        # sklearn negates the decision of binary SVCs
+        return -scores if self.classes_.size == 2 else scores
+
+    def _svc_proba(self, scores):
+        # libsvm's pairwise coupling (svm_predict_probability)
+        n_classes = self.classes_.size
+        r = np.zeros((scores.shape[0], n_classes, n_classes))
+        for (k, (i, j)) in enumerate(_ovo_pairs(n_classes)):
+            f = self._libsvm_decision(scores[:, k]) * self._probA[k] + self._probB[k]
+            p = np.where(f >= 0, np.exp(-np.abs(f)) / (1 + np.exp(-np.abs(f))), 1 / (1 + np.exp(-np.abs(f))))
+            p = np.clip(p, 1e-7, 1 - 1e-7)
+            r[:, i, j] = p
+            r[:, j, i] = 1 - p
+        return _multiclass_probability(r)
+
+
+# -- export helpers
+
+def _describe(pipe, sanitizer_version):
+    steps = [step for (_, step) in pipe.steps] if hasattr(pipe, 'steps') else [pipe]
+    if len(steps) < 2 or not isinstance(steps[0], CountVectorizer):
+        raise ValueError("unsupported pipeline: the first step must be a CountVectorizer or TfidfVectorizer")
+    (vec, transformers, clf) = (steps[0], steps[1:-1], steps[-1])
+
+    recorded = getattr(pipe, 'sanitizer_version', None)
+    if recorded is not None and sanitizer_version is not None and recorded != sanitizer_version:
+        raise ValueError("the pipeline was trained with the sanitizer '%s', got '%s'" % (recorded, sanitizer_version))
+
+    arrays = dict()
+    vectorizer = _vectorizer_meta(vec, transformers, arrays)
+    classifier = _classifier_meta(clf, arrays)
+    arrays = dict((name, np.ascontiguousarray(array)) for (name, array) in arrays.items())
+    meta = dict(
+        format=FORMAT_VERSION,
+        sanitizer_version=recorded or sanitizer_version,
+        vectorizer=vectorizer,
+        classifier=classifier)
+    return meta, arrays
+
+
+def _vectorizer_meta(vec, transformers, arrays) -> dict:
+    for attr in ['preprocessor', 'tokenizer']:
+        if getattr(vec, attr, None) is not None:
+            raise ValueError("unsupported vectorizer: custom %s" % attr)
+    if callable(vec.analyzer):
+        raise ValueError("unsupported vectorizer: custom analyzer")
+
+    params = dict((p, getattr(vec, p)) for p in _ANALYZER_PARAMS)
+    params['ngram_range'] = list(params['ngram_range'])
+    if params['stop_words'] is not None and not isinstance(params['stop_words'], str):
+        params['stop_words'] = sorted(params['stop_words'])
+
+    if isinstance(vec, TfidfVectorizer):
+        tfidf = vec
+    elif len(transformers) == 1 and isinstance(transformers[0], TfidfTransformer):
+        tfidf = transformers[0]
+    elif len(transformers) == 0:
+        tfidf = None
+    else:
+        raise ValueError("unsupported pipeline: only a TfidfTransformer may follow the vectorizer")
+
+    (terms, columns) = zip(*sorted(vec.vocabulary_.items())) if vec.vocabulary_ else ((), ())
+    arrays['terms'] = np.array(terms, dtype=str)
+    arrays['columns'] = np.array(columns, dtype=np.int64)
+    tfidf_meta = None
+    if tfidf is not None:
+        tfidf_meta = dict((p, getattr(tfidf, p)) for p in _TFIDF_PARAMS)
+        if tfidf.use_idf:
+            arrays['idf'] = np.asarray(tfidf.idf_, dtype=np.float64)
+    return dict(params=params, binary=vec.binary, dtype=np.dtype(vec.dtype).name, tfidf=tfidf_meta)
+
+
+def _classifier_meta(clf, arrays) -> dict:
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.svm import LinearSVC, SVC
+
+    arrays['classes'] = np.asarray(clf.classes_)
+    if isinstance(clf, LogisticRegression):
+        arrays['coef'] = clf.coef_
+        arrays['intercept'] = np.asarray(clf.intercept_, dtype=np.float64)
+        return dict(kind='logistic', multi_class=_multi_class(clf))
+    if isinstance(clf, MultinomialNB):
+        arrays['feature_log_prob'] = clf.feature_log_prob_
+        arrays['class_log_prior'] = clf.class_log_prior_
+        return dict(kind='multinomial_nb')
+    if isinstance(clf, LinearSVC):
+        arrays['coef'] = clf.coef_
+        arrays['intercept'] = np.asarray(clf.intercept_, dtype=np.float64)
+        return dict(kind='linear_svc')
+    if isinstance(clf, SVC) and clf.kernel == 'linear':
+        coef = clf.coef_
+        arrays['coef'] = coef.toarray() if hasattr(coef, 'toarray') else np.asarray(coef)
+        arrays['intercept'] = np.asarray(clf.intercept_, dtype=np.float64)
+        probability = bool(clf.probability)
+        if probability:
+            arrays['probA'] = np.asarray(clf.probA_, dtype=np.float64)
+            arrays['probB'] = np.asarray(clf.probB_, dtype=np.float64)
+        return dict(kind='svc', probability=probability)
+    raise ValueError("unsupported classifier: %s" % type(clf).__name__)
+
+
+def _multi_class(clf) -> str:
+    # sklearn < 0.22 defaults to 'ovr', later versions choose it from the solver and classes
+    multi_class = getattr(clf, 'multi_class', 'auto')
+    if multi_class in ('ovr', 'multinomial'):
+        return multi_class
+    return 'ovr' if clf.solver == 'liblinear' or len(clf.classes_) <= 2 else 'multinomial'
+
+
+# -- math helpers
+
+def _ovo_pairs(n_classes):
+    return [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+
+
+def _expit(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    np.exp(scores, scores)
+    return scores / scores.sum(axis=1, keepdims=True)
+
+
+def _multiclass_probability(r, max_iter=100):
+    """
+    libsvm's multiclass_probability (Wu, Lin and Weng, 2004), for all the samples at once.
+    :param r: the pairwise probabilities, of shape (n_samples, n_classes, n_classes).
+    """
+    (n, k, _) = r.shape
+    Q = -r.transpose(0, 2, 1) * r
+    diag = np.einsum('nji,nji->ni', r, r) - np.einsum('nii,nii->ni', r, r)
+    Q[:, np.arange(k), np.arange(k)] = diag
+    p = np.full((n, k), 1.0 / k)
+    eps = 0.005 / k
+    active = np.arange(n)
+    for _ in range(max(max_iter, k)):
+        (Qa, pa) = (Q[active], p[active])
+        Qp = np.einsum('nij,nj->ni', Qa, pa)
+        pQp = np.einsum('ni,ni->n', pa, Qp)
+        converged = np.abs(Qp - pQp[:, None]).max(axis=1) < eps
+        (active, Qa, pa, Qp, pQp) = (active[~converged], Qa[~converged], pa[~converged],
+                                     Qp[~converged], pQp[~converged])
+        if active.size == 0:
+            break
+        for t in range(k):
+            diff = (-Qp[:, t] + pQp) / Qa[:, t, t]
+            pa[:, t] += diff
+            pQp = (pQp + diff * (diff * Qa[:, t, t] + 2 * Qp[:, t])) / (1 + diff) / (1 + diff)
+            Qp = (Qp + diff[:, None] * Qa[:, t, :]) / (1 + diff)[:, None]
+            pa /= (1 + diff)[:, None]
+        p[active] = pa
+    return p
@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ['kind', 'texts', 'future', 'time']
+
+    def __init__(self, kind, texts):
+        self.kind = kind
+        self.texts = texts
+        self.future = Future()
+        self.time = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Gather the predictions requested by concurrent threads (e.g. the requests of the webapp) into
+    batches: a batch is predicted in one call, as soon as it holds :param max_batch: sentences or
+    :param max_wait: seconds after its first request. Each request then gets its slice of the results.
+
+    Requests of different kinds (predict, predict_proba) are never mixed in a batch.
+    The statistics (queue depth, distribution of the batch sizes) are available through report().
+    """
+
+    def __init__(self, predict, max_wait=0.005, max_batch=256):
+        """
+        :param predict: the function (kind, texts) => results, with one result per text.
+        :param max_wait: the maximal time a request waits for others, in seconds.
+        :param max_batch: the number of sentences triggering a batch immediately.
+        """
+        self.predict = predict
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._postponed = deque()  # requests of another kind than the current batch (worker thread only)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.clear()
+
+    def run(self, kind: str, texts: np.ndarray):
+        """
+        Predict :param texts: in the next batch and wait for the results.
+        :param kind: the method of the pipeline to call, e.g. 'predict_proba'.
+        """
+        return self.submit(kind, texts).result()
+
+    def submit(self, kind: str, texts: np.ndarray) -> Future:
+        """ :return: a Future of the results of :param texts: (see run). """
+        self._start()
+        request = _Request(kind, texts)
+        self._queue.put(request)
+        depth = self.queue_depth
+        with self._lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        return request.future
+
+    @property
+    def queue_depth(self) -> int:
+        """ The number of requests waiting for a batch. """
+        return self._queue.qsize() + len(self._postponed)
+
+    def report(self) -> dict:
+        """
+        :return: the number of requests, batches and sentences, the current and maximal queue depth,
+            the mean wait of the requests (ms), and the distribution of the batch sizes
+            (number of batches by size, rounded up to a power of 2).
+        """
+        with self._lock:
+            return dict(
+                requests=self.requests, batches=self.batches, sentences=self.sentences,
+                queue_depth=self.queue_depth, max_queue_depth=self.max_queue_depth,
+                mean_batch_size=self.sentences / self.batches if self.batches else 0,
+                mean_wait_ms=self._wait * 1000 / self.requests if self.requests else 0,
+                batch_sizes=dict(sorted(self._sizes.items())),
+                max_wait_ms=self.max_wait * 1000, max_batch=self.max_batch)
+
+    def clear(self):
+        """ Reset the statistics. """
+        with self._lock:
+            self.requests = 0
+            self.batches = 0
+            self.sentences = 0
+            self.max_queue_depth = 0
+            self._wait = 0.0
+            self._sizes = Counter()
+
+    # -- private methods
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name='micro-batcher', daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._process(self._next_batch())
+
+    def _next_batch(self):
+        first = self._postponed.popleft() if self._postponed else self._queue.get()
+        batch = [first]
+        size = len(first.texts)
+        deadline = first.time + self.max_wait
+        # postponed requests of the same kind first, then the new ones until the deadline
+        for request in [r for r in self._postponed if r.kind == first.kind]:
+            self._postponed.remove(request)
+            batch.append(request)
+            size += len(request.texts)
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request.kind != first.kind:
+                self._postponed.append(request)
+                continue
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _process(self, batch):
+        start = time.monotonic()
+        texts = np.concatenate([np.asarray(r.texts, dtype=object) for r in batch])
+        with self._lock:
+            self.batches += 1
+            self.sentences += texts.size
+            self._sizes[1 << max(texts.size - 1, 0).bit_length()] += 1
+            self._wait += sum(start - r.time for r in batch)
+        try:
+            results = self.predict(batch[0].kind, texts)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        offset = 0
+        for request in batch:
+            request.future.set_result(results[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+
+    def __repr__(self):
+        return "MicroBatcher(max_wait=%r, max_batch=%r)" % (self.max_wait, self.max_batch)
@@ -0,0 +1,520 @@
+"""
+Pure python text-block extraction, following the boilerpipe algorithms (Kohlschütter et al.,
+"Boilerplate Detection using Shallow Text Features", WSDM 2010).
+
+The html is parsed in one streaming pass into text blocks (the text between two block-level tags),
+each with its number of words, its link density (words inside <a>) and its text density (words per
+80-characters line). The extractors (see EXTRACTORS) then mark the blocks holding the content, using
+the same classifiers and filters as their boilerpipe counterpart.
+"""
+import re
+from html.parser import HTMLParser
+from typing import List
+
+# labels of the blocks
+TITLE = 'title'
+HEADING = 'heading'
+LI = 'li'
+END_OF_TEXT = 'end-of-text'
+VERY_LIKELY_CONTENT = 'very-likely-content'
+MIGHT_BE_CONTENT = 'might-be-content'
+
+_MAX_LINE_LENGTH = 80
+
+# tags whose content is ignored
+_IGNORED = {'style', 'script', 'option', 'object', 'applet', 'noscript', 'textarea', 'select', 'template'}
+# tags that do not end the current block
+_INLINE = {'a', 'abbr', 'acronym', 'b', 'big', 'cite', 'code', 'em', 'font', 'i', 'q', 's', 'small', 'span',
+           'strike', 'strong', 'sub', 'sup', 'tt', 'u', 'var', 'label', 'mark', 'time'}
+# tags without end tag
+_VOID = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+_HEADINGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+# tags implicitly closed by the start of the same tag (e.g. <li>a<li>b)
+_SELF_CLOSING = {'p', 'li', 'option', 'dt', 'dd', 'tr', 'td', 'th'}
+# tags allowed in <head>: any other tag (or text) starts the body, even without <body> (as in HTML5)
+_HEAD = {'head', 'title', 'meta', 'link', 'style', 'script', 'base', 'basefont', 'bgsound', 'noscript',
+         'noframes', 'template'}
+
+_reg_word = re.compile(r"[^\W_]")
+_reg_spaces = re.compile(r"\s+")
+_reg_clause_delimiter = re.compile(r"\b[,.:;!?]+(?:\s+|\Z)")
+
+
+class TextBlock:
+    """ A block of text and its shallow features. """
+
+    __slots__ = ['text', 'num_words', 'num_linked_words', 'num_words_in_wrapped_lines', 'num_wrapped_lines',
+                 'offset_start', 'offset_end', 'tag_level', 'labels', 'is_content', 'text_density', 'link_density']
+
+    def __init__(self, text='', num_words=0, num_linked_words=0, num_words_in_wrapped_lines=0, num_wrapped_lines=0,
+                 offset=0, tag_level=0, labels=()):
+        self.text = text
+        self.num_words = num_words
+        self.num_linked_words = num_linked_words
+        self.num_words_in_wrapped_lines = num_words_in_wrapped_lines
+        self.num_wrapped_lines = num_wrapped_lines
+        self.offset_start = offset
+        self.offset_end = offset
+        self.tag_level = tag_level
+        self.labels = set(labels)
+        self.is_content = False
+        self._init_densities()
+
+    def merge_next(self, other: 'TextBlock'):
+        """ Append the text and features of :param other: to this block. """
+        self.text += '\n' + other.text
+        self.num_words += other.num_words
+        self.num_linked_words += other.num_linked_words
+        self.num_words_in_wrapped_lines += other.num_words_in_wrapped_lines
+        self.num_wrapped_lines += other.num_wrapped_lines
+        self.offset_start = min(self.offset_start, other.offset_start)
+        self.offset_end = max(self.offset_end, other.offset_end)
+        self.is_content |= other.is_content
+        self.labels |= other.labels
+        self.tag_level = min(self.tag_level, other.tag_level)
+        self._init_densities()
+
+    def _init_densities(self):
+        if self.num_words_in_wrapped_lines == 0:
+            self.num_words_in_wrapped_lines = self.num_words
+            self.num_wrapped_lines = 1
+        self.text_density = self.num_words_in_wrapped_lines / self.num_wrapped_lines
+        self.link_density = self.num_linked_words / self.num_words if self.num_words > 0 else 0
+
+    def __repr__(self):
+        return "TextBlock(%r, words=%d, text_density=%.2f, link_density=%.2f, content=%s)" % (
+            self.text[:40], self.num_words, self.text_density, self.link_density, self.is_content)
+
+
+_EMPTY = TextBlock()  # the neighbour of the first and last blocks
+
+
+class _BlockParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.title = None
+        self._text = []  # the text of the current block
+        self._words = 0
+        self._linked_words = 0
+        self._wrapped_lines = 0
+        self._line_words = 0
+        self._line_length = 0
+        self._open = []  # the open block tags: (tag, label), the label being heading, li or None
+        self._ignored = 0
+        self._anchor = 0
+        self._in_title = False
+        self._in_head = False
+        self._title = []
+
+    def handle_starttag(self, tag, attrs):
+        if self._in_head and tag not in _HEAD:
+            self._in_head = False
+        if tag in _IGNORED:
+            self._ignored += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag == 'head':
+            self._in_head = True
+        elif tag == 'body':
+            self._in_head = False
+            self._flush()
+        elif tag == 'a':
+            self._anchor += 1
+            self._text.append(' ')
+        elif tag in _INLINE:
+            pass
+        elif tag in _VOID:
+            self._flush()
+        else:
+            self._flush()
+            if tag in _SELF_CLOSING and self._open and self._open[-1][0] == tag:
+                self._open.pop()
+            self._open.append((tag, HEADING if tag in _HEADINGS else LI if tag == 'li' else None))
+
+    def handle_startendtag(self, tag, attrs):
+        if self._in_head and tag not in _HEAD:
+            self._in_head = False
+        if tag not in _INLINE:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in _IGNORED:
+            self._ignored = max(self._ignored - 1, 0)
+        elif tag == 'title':
+            self._in_title = False
+        elif tag == 'head':
+            self._in_head = False
+        elif tag == 'a':
+            self._anchor = max(self._anchor - 1, 0)
+            self._text.append(' ')
+        elif tag in _INLINE or tag in _VOID:
+            pass
+        else:
+            self._flush()
+            # close the tags left open inside this one (unbalanced html)
+            for i in range(len(self._open) - 1, -1, -1):
+                if self._open[i][0] == tag:
+                    del self._open[i:]
+                    break
+
+    def handle_data(self, data):
+        if self._ignored:
+            return
+        if self._in_title:
+            self._title.append(data)
+            return
+        if self._in_head:
+            if not data.strip():
+                return
+            self._in_head = False
+        self._text.append(data)
+        for token in data.split():
+            if _reg_word.search(token) is None:
+                continue
+            self._words += 1
+            self._line_words += 1
+            if self._anchor:
+                self._linked_words += 1
+            self._line_length += len(token) + 1
+            if self._line_length > _MAX_LINE_LENGTH:
+                self._wrapped_lines += 1
+                self._line_length = len(token)
+                self._line_words = 1
+
+    def close(self):
+        super().close()
+        self._flush()
+        if self._title:
+            self.title = _reg_spaces.sub(' ', ''.join(self._title)).strip() or None
+
+    def _flush(self):
+        if self._words > 0:
+            if self._wrapped_lines == 0:
+                (words_in_wrapped_lines, wrapped_lines) = (self._words, 1)
+            else:
+                # the last line is not full: leave it out of the text density
+                (words_in_wrapped_lines, wrapped_lines) = (self._words - self._line_words, self._wrapped_lines)
+            self.blocks.append(TextBlock(
+                _reg_spaces.sub(' ', ''.join(self._text)).strip(), self._words, self._linked_words,
+                words_in_wrapped_lines, wrapped_lines, len(self.blocks), len(self._open),
+                [label for (_, label) in self._open if label is not None]))
+        self._text = []
+        self._words = self._linked_words = self._wrapped_lines = self._line_words = self._line_length = 0
+
+
+def parse_blocks(html) -> tuple:
+    """
+    :param html: the html, as a string or an iterable of string chunks (parsed as they come).
+    :return: a tuple (blocks, title) with the TextBlocks of :param html: and the content of its <title>.
+    """
+    parser = _BlockParser()
+    for chunk in ([html] if isinstance(html, str) else html):
+        parser.feed(chunk)
+    parser.close()
+    return parser.blocks, parser.title
+
+
+def extract_blocks(html, extractor_name='DefaultExtractor') -> List[str]:
+    """
+    :param extractor_name: one of EXTRACTORS.
+    :return: the text of the content blocks of :param html:, as boilerpipe's getTextBlocks.
+    """
+    if extractor_name not in EXTRACTORS:
+        raise ValueError("unknown extractor '%s', expected one of %s" % (extractor_name, list(EXTRACTORS)))
+    (blocks, title) = parse_blocks(html)
+    blocks = EXTRACTORS[extractor_name](blocks, title)
+    return [b.text for b in blocks if b.is_content]
+
+
+# -- classifiers
+
+def _classify(blocks, rule):
+    """ Set is_content of each block to rule(previous, current, next). """
+    for (i, block) in enumerate(blocks):
+        prev = blocks[i - 1] if i > 0 else _EMPTY
+        nxt = blocks[i + 1] if i + 1 < len(blocks) else _EMPTY
+        block.is_content = rule(prev, block, nxt)
+
+
+def _density_rules(prev, curr, nxt) -> bool:
+    if curr.link_density > 0.333333:
+        return False
+    if prev.link_density <= 0.555556:
+        if curr.text_density <= 9:
+            if nxt.text_density <= 10:
+                return prev.text_density > 4
+            return True
+        return nxt.text_density != 0
+    return nxt.text_density > 11
+
+
+def _num_words_rules(prev, curr, nxt) -> bool:
+    if curr.link_density > 0.333333:
+        return False
+    if prev.link_density <= 0.555556:
+        if curr.num_words <= 16:
+            if nxt.num_words <= 15:
+                return prev.num_words > 4
+            return True
+        return True
+    return curr.num_words > 40 or nxt.num_words > 17
+
+
+def _canola_rules(prev, curr, nxt) -> bool:
+    return (curr.link_density > 0 and nxt.num_words > 11) or curr.num_words > 19 or (
+        nxt.num_words > 6 and nxt.link_density == 0 and prev.link_density == 0 and
+        (curr.num_words > 6 or prev.num_words > 7 or nxt.num_words > 19))
+
+
+# -- filters
+
+def _fuse_same_density(blocks):
+    """ Merge the adjacent blocks with the same text density. """
+    if not blocks:
+        return blocks
+    fused = [blocks[0]]
+    for block in blocks[1:]:
+        if fused[-1].text_density == block.text_density:
+            fused[-1].merge_next(block)
+        else:
+            fused.append(block)
+    return fused
+
+
+def _fuse_proximity(blocks, max_distance=1, content_only=False, same_tag_level=False):
+    """ Merge the content blocks at most :param max_distance: blocks away from the previous one. """
+    if content_only:
+        start = next((i for (i, b) in enumerate(blocks) if b.is_content), None)
+        if start is None:
+            return blocks
+    else:
+        start = 0
+    if start >= len(blocks):
+        return blocks
+    fused = blocks[:start + 1]
+    prev = blocks[start]
+    for block in blocks[start + 1:]:
+        if block.is_content and block.offset_start - prev.offset_end - 1 <= max_distance and \
+                (not content_only or prev.is_content) and \
+                (not same_tag_level or prev.tag_level == block.tag_level):
+            prev.merge_next(block)
+        else:
+            fused.append(block)
+            prev = block
+    return fused
+
+
+def _mark_end_of_text(blocks):
+    """ Label the short blocks typical of the end of an article (comments...). """
+    for block in blocks:
+        if block.num_words < 15:
+            text = block.text.strip().lower()
+            if len(text) >= 8 and (
+                    text.startswith(('comments', '© reuters', 'please rate this', 'post a comment')) or
+                    re.match(r"\d+ (comments|users responded in)", text) is not None or
+                    any(s in text for s in ('what you think...', 'add your comment', 'add comment', 'reader views',
+                                            'have your say', 'reader comments', 'rätta artikeln')) or
+                    text == 'thanks for your comments - this feedback is now closed'):
+                block.labels.add(END_OF_TEXT)
+        elif block.link_density == 1 and block.text.strip() == 'Comment':
+            block.labels.add(END_OF_TEXT)
+
+
+def _potential_titles(title):
+    title = _normalize_title(title)
+    titles = {title}
+    for separators in ("[|»-]", "[|»:]", "[|»:()]", "[|»:()\\-]", "[|»,:()\\-]", "[|»,:()\\-\u00a0]"):
+        parts = [p for p in re.split(r" *%s *" % separators, title) if '.com' not in p]
+        if len(parts) > 1:
+            longest = max(parts, key=lambda p: (len(p.split()), len(p)))
+            if len(longest.split()) > 2:
+                titles.add(longest)
+    for separator in (r" +\| +", r" +- +"):
+        titles.update(p for p in re.split(separator, title) if len(p.split()) >= 4)
+    titles.add(re.sub(r" - [^\-]+$", '', title, count=1))
+    titles.add(re.sub(r"^[^\-]+ - ", '', title, count=1))
+    return titles
+
+
+def _normalize_title(text):
+    return text.replace('\u00a0', ' ').replace("'", '').strip().lower()
+
+
+def _mark_title(blocks, title):
+    """ Label the block matching the title of the document. """
+    if not title:
+        return
+    titles = _potential_titles(title)
+    for block in blocks:
+        text = _normalize_title(block.text)
+        if text in titles or text.rstrip('.:!?') in titles:
+            block.labels.add(TITLE)
+            break
+
+
+def _ignore_after_content(blocks, min_words=60):
+    """ Once :param min_words: words of content are followed by an end-of-text block, ignore the rest. """
+    words = 0
+    found = False
+    for block in blocks:
+        if block.is_content and block.text_density >= 9:
+            words += block.num_words
+        if END_OF_TEXT in block.labels and words >= min_words:
+            found = True
+        if found:
+            block.is_content = False
+
+
+def _trailing_headlines_to_boilerplate(blocks):
+    for block in reversed(blocks):
+        if block.is_content:
+            if HEADING not in block.labels:
+                break
+            block.is_content = False
+
+
+def _keep_largest_block(blocks, expand_to_same_tag_level=False, min_words=0):
+    """ Only keep the content block with the most words (and, if expanding, the large blocks around at its level). """
+    largest = max((b for b in blocks if b.is_content), key=lambda b: b.num_words, default=None)
+    if largest is None:
+        return
+    for block in blocks:
+        block.is_content = block is largest
+        block.labels.add(VERY_LIKELY_CONTENT if block is largest else MIGHT_BE_CONTENT)
+    if expand_to_same_tag_level:
+        index = blocks.index(largest)
+        for side in (reversed(blocks[:index]), blocks[index + 1:]):
+            for block in side:
+                if block.tag_level < largest.tag_level:
+                    break
+                if block.tag_level == largest.tag_level and block.num_words >= min_words:
+                    block.is_content = True
+
+
+def _expand_title_to_content(blocks):
+    """ Mark as content the blocks which might be content between the title and the content. """
+    (title, start) = (-1, -1)
+    for (i, block) in enumerate(blocks):
+        if start == -1 and TITLE in block.labels:
+            title = i
+        if start == -1 and block.is_content:
+            start = i
+    if title == -1 or start <= title:
+        return
+    for block in blocks[title:start]:
+        if MIGHT_BE_CONTENT in block.labels:
+            block.is_content = True
+
+
+def _large_blocks_same_tag_level_to_content(blocks, min_words=100):
+    level = next((b.tag_level for b in blocks if b.is_content and VERY_LIKELY_CONTENT in b.labels), None)
+    if level is None:
+        return
+    for block in blocks:
+        if not block.is_content and block.num_words >= min_words and block.tag_level == level:
+            block.is_content = True
+
+
+def _list_at_end(blocks):
+    """ Mark as content the list items (without links) following the content, below its tag level. """
+    level = None
+    for block in blocks:
+        if block.is_content and VERY_LIKELY_CONTENT in block.labels:
+            level = block.tag_level
+        elif level is not None and block.tag_level > level and MIGHT_BE_CONTENT in block.labels and \
+                LI in block.labels and block.link_density == 0:
+            block.is_content = True
+        else:
+            level = None
+
+
+def _split_paragraphs(blocks):
+    """ Split the blocks into one block per line (merged blocks are joined by new lines). """
+    split = []
+    for block in blocks:
+        lines = [line for line in block.text.split('\n') if line.strip()]
+        if len(lines) <= 1:
+            split.append(block)
+            continue
+        for line in lines:
+            words = sum(1 for token in line.split() if _reg_word.search(token) is not None)
+            paragraph = TextBlock(line, words, 0, 0, 0, block.offset_start, block.tag_level, block.labels)
+            paragraph.is_content = block.is_content
+            split.append(paragraph)
+    return split
+
+
+def _min_clause_words(blocks, min_words=5):
+    """ Only keep the content blocks with at least one clause (ended by a punctuation) of :param min_words: words. """
+    for block in blocks:
+        if block.is_content:
+            clauses = _reg_clause_delimiter.split(block.text)[:-1]  # the last clause has no delimiter
+            block.is_content = any(len(clause.split()) >= min_words for clause in clauses)
+
+
+# -- extractors
+
+def default_extractor(blocks, title=None):
+    blocks = _fuse_same_density(blocks)
+    # (boilerpipe's proximity fusion is a no-op here: no block is content yet)
+    _classify(blocks, _density_rules)
+    return blocks
+
+
+def article_extractor(blocks, title=None):
+    _mark_end_of_text(blocks)
+    _mark_title(blocks, title)
+    _classify(blocks, _num_words_rules)
+    _ignore_after_content(blocks)
+    _trailing_headlines_to_boilerplate(blocks)
+    blocks = _fuse_proximity(blocks)
+    blocks = [b for b in blocks if b.is_content or TITLE in b.labels]
+    blocks = _fuse_proximity(blocks, content_only=True, same_tag_level=True)
+    _keep_largest_block(blocks, expand_to_same_tag_level=True, min_words=150)
+    _expand_title_to_content(blocks)
+    _large_blocks_same_tag_level_to_content(blocks)
+    _list_at_end(blocks)
+    return blocks
+
+
+def article_sentences_extractor(blocks, title=None):
+    blocks = _split_paragraphs(article_extractor(blocks, title))
+    _min_clause_words(blocks)
+    return blocks
+
+
+def keep_everything_extractor(blocks, title=None):
+    for block in blocks:
+        block.is_content = True
+    return blocks
+
+
+def largest_content_extractor(blocks, title=None):
+    _classify(blocks, _num_words_rules)
+    blocks = _fuse_proximity(blocks)
+    _keep_largest_block(blocks)
+    return blocks
+
+
+def num_words_rules_extractor(blocks, title=None):
+    _classify(blocks, _num_words_rules)
+    return blocks
+
+
+def canola_extractor(blocks, title=None):
+    _classify(blocks, _canola_rules)
+    return blocks
+
+
+# the extractors, by boilerpipe name: function (blocks, title) => blocks, with is_content set
+EXTRACTORS = {
+    'DefaultExtractor': default_extractor,
+    'ArticleExtractor': article_extractor,
+    'ArticleSentencesExtractor': article_sentences_extractor,
+    'KeepEverythingExtractor': keep_everything_extractor,
+    'LargestContentExtractor': largest_content_extractor,
+    'NumWordsRulesExtractor': num_words_rules_extractor,
+    'CanolaExtractor': canola_extractor,
+}
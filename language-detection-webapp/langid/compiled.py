@@ -0,0 +1,176 @@
+"""
+Fused n-gram weight tables.
+
+For a linear classifier on top of a fixed vocabulary, the decision of a text is the sum, over its
+n-grams, of a weight vector (one weight per class) scaled by the tf-idf of the n-gram. compile_pipeline
+folds the idf and the classifier coefficients into one table term => weights, so that predicting
+only requires looking up the n-grams of the texts: no sparse matrix, no sklearn dispatch.
+"""
+import numpy as np
+
+from .artifact import ArtifactPipeline, artifact_of
+
+
+PRECISIONS = ['float64', 'float32', 'int8']
+
+
+def compile_pipeline(pipe, sanitizer_version=None, precision='float64') -> 'CompiledPipeline':
+    """
+    :param pipe: an ArtifactPipeline (see artifact.load_artifact) or a supported sklearn pipeline
+        (see artifact.export_artifact).
+    :param precision: the type of the weight table, see CompiledPipeline.
+    :return: the CompiledPipeline of :param pipe:.
+    :raise ValueError: if the pipeline is not supported.
+    """
+    if isinstance(pipe, CompiledPipeline):
+        raise ValueError("the pipeline is already compiled")
+    if not isinstance(pipe, ArtifactPipeline):
+        pipe = artifact_of(pipe, sanitizer_version)
+    return CompiledPipeline(pipe.meta, pipe.arrays, pipe.directory, precision)
+
+
+def compare(reference, compiled, texts) -> dict:
+    """
+    Compare the predictions of :param compiled: with the ones of :param reference: on :param texts:.
+    :return: a dict with the agreement of the predicted labels and the maximal difference of
+        the probabilities (None if the model has no predict_proba).
+    """
+    agreement = float(np.mean(np.asarray(reference.predict(texts)) == compiled.predict(texts)))
+    try:
+        max_diff = float(np.abs(reference.predict_proba(texts) - compiled.predict_proba(texts)).max())
+    except AttributeError:
+        max_diff = None
+    return dict(n=len(texts), agreement=agreement, max_proba_diff=max_diff)
+
+
+def evaluate_precisions(pipe, datasets, precisions=PRECISIONS) -> dict:
+    """
+    Evaluate the quantized forms of :param pipe: (see compile_pipeline).
+    :param datasets: the evaluation sets, by name: tuples (texts, labels), the texts being sanitized.
+    :return: for each precision, a dict with the size of the table, the accuracy on each dataset,
+        and the comparison with the float64 table on all the texts (see compare).
+    """
+    if not isinstance(pipe, ArtifactPipeline):
+        pipe = artifact_of(pipe)
+    texts = [text for (X, _) in datasets.values() for text in X]
+    reference = compile_pipeline(pipe)
+    results = dict()
+    for precision in precisions:
+        compiled = compile_pipeline(pipe, precision=precision)
+        res = dict(nbytes=compiled.nbytes)
+        for (name, (X, y)) in datasets.items():
+            res[name] = float(np.mean(compiled.predict(X) == np.asarray(y)))
+        res.update(compare(reference, compiled, texts))
+        results[precision] = res
+    return results
+
+
+class CompiledPipeline(ArtifactPipeline):
+    """
+    An ArtifactPipeline whose decision function uses a fused weight table: row i holds the
+    classifier weights of the i-th term of the vocabulary, multiplied by its idf.
+    The tf transformations (binary, sublinear) and the normalization are applied on the fly.
+
+    The table can be quantized: with the float32 precision, the scores are computed in float32;
+    with int8, each column (class) of the table is scaled to [-127, 127] and the scores are
+    rescaled once summed. The table is 2 (float32) or 8 (int8) times smaller.
+    """
+
+    def __init__(self, meta, arrays, directory=None, precision='float64'):
+        """
+        :param precision: the type of the weight table, one of PRECISIONS.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError("unknown precision '%s', expected one of %s" % (precision, PRECISIONS))
+        super().__init__(meta, arrays, directory)
+        self.precision = precision
+        weights = np.asarray(self._coef).T[self._columns]
+        self._term_idf = None
+        if self._idf is not None:
+            self._term_idf = np.asarray(self._idf)[self._columns]
+            weights = weights * self._term_idf[:, None]
+        vec = meta['vectorizer']
+        tfidf = vec['tfidf'] or dict()
+        self._binary = vec['binary']
+        self._sublinear = tfidf.get('sublinear_tf', False)
+        self._norm = tfidf.get('norm')
+
+        self._scales = None
+        if precision == 'int8':
+            self._scales = np.abs(weights).max(axis=0) / 127
+            self._scales[self._scales == 0] = 1
+            weights = np.rint(weights / self._scales).astype(np.int8)
+        elif precision == 'float32':
+            weights = weights.astype(np.float32)
+        self._weights = weights
+
+        # the table replaces the coefficients and idf: do not keep them
+        self._n_features = self._coef.shape[1]
+        (self._coef, self._idf) = (None, None)
+        self.arrays = dict((name, array) for (name, array) in arrays.items()
+                           if name not in ('coef', 'feature_log_prob', 'idf'))
+
+    @property
+    def weights(self) -> np.ndarray:
+        """ The weight table, of shape (n_terms, n_outputs), in the order of the terms table. """
+        return self._weights
+
+    @property
+    def n_features(self) -> int:
+        return self._n_features
+
+    @property
+    def nbytes(self) -> int:
+        """ The size of the weight table. """
+        return self._weights.nbytes
+
+    def transform(self, texts):
+        raise AttributeError("a CompiledPipeline does not build document-term matrices")
+
+    def decision_function(self, texts) -> np.ndarray:
+        (rows, pos, n_docs) = self._positions(texts)
+        # float64 tables are summed in float64, quantized ones in float32
+        dtype = np.float64 if self.precision == 'float64' else np.float32
+        if self._binary or self._sublinear or self._norm is not None:
+            (rows, pos, factors) = self._term_factors(rows, pos, n_docs)
+            contributions = self._weights[pos] * factors.astype(dtype)[:, None]
+        else:
+            # raw counts: each occurrence adds the weights of its term
+            contributions = self._weights[pos].astype(dtype, copy=False)
+
+        scores = np.zeros((n_docs, self._weights.shape[1]), dtype=dtype)
+        # rows are sorted: sum the contributions of each (non empty) document
+        counts = np.bincount(rows, minlength=n_docs)
+        non_empty = np.flatnonzero(counts)
+        if non_empty.size > 0:
+            starts = np.concatenate([[0], np.cumsum(counts[non_empty])[:-1]])
+            scores[non_empty] = np.add.reduceat(contributions, starts, axis=0)
+        scores = scores.astype(np.float64)
+        if self._scales is not None:
+            scores *= self._scales
+        return scores + self._intercept
+
+    # -- private methods
+
+    def _term_factors(self, rows, pos, n_docs):
+        """
+        :return: a tuple (rows, pos, factors) with one entry per distinct (document, term),
+            factors being the weight of the term in the document, the idf excepted.
+        """
+        keys = rows * self._terms.size + pos
+        (keys, tf) = np.unique(keys, return_counts=True)
+        (rows, pos) = np.divmod(keys, self._terms.size)
+        tf = tf.astype(np.float64)
+        if self._binary:
+            tf.fill(1)
+        if self._sublinear:
+            tf = np.log(tf) + 1
+        if self._norm is not None:
+            values = tf * self._term_idf[pos] if self._term_idf is not None else tf
+            if self._norm == 'l2':
+                norms = np.sqrt(np.bincount(rows, values ** 2, minlength=n_docs))
+            else:
+                norms = np.bincount(rows, np.abs(values), minlength=n_docs)
+            norms[norms == 0] = 1
+            tf /= norms[rows]
+        return rows, pos, tf
@@ -0,0 +1,63 @@
+"""
+Extraction of the text blocks of a page, with two backends:
+
+* boilerpipe: the original java implementation, through jpype (optional dependency). boilerpipe
+  downloads the page itself, as it always did (Extractor.getTextBlocks(url=...));
+* python: the pure python implementation of blocks.py, same extractor names, no JVM, which parses
+  the page fetched through the fetcher (pooled connections, html cache, see fetching.py).
+
+The boilerpipe backend is the default. The python backend is experimental: it is not a drop-in replacement
+until check_extraction.py shows that it extracts the same blocks as boilerpipe on recorded real pages.
+"""
+import logging
+from typing import List
+
+from . import blocks
+from .fetching import fetcher
+
+try:
+    from boilerpipe.extract import Extractor
+except ImportError:  # boilerpipe and the JVM are optional
+    Extractor = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ['boilerpipe', 'python']
+
+backend = 'boilerpipe'
+
+
+def use_backend(name: str):
+    """ Extract the text blocks with the backend :param name: (one of BACKENDS) from now on. """
+    global backend
+    if name not in BACKENDS:
+        raise ValueError("unknown extraction backend '%s', expected one of %s" % (name, BACKENDS))
+    if name == 'boilerpipe' and Extractor is None:
+        raise ValueError("the boilerpipe backend is not available: boilerpipe is not installed")
+    if name == 'python':
+        logger.warning("the python extraction backend is experimental: its agreement with boilerpipe "
+                       "is only checked on the recorded pages (see check_extraction.py)")
+    backend = name
+
+
+def text_blocks(url: str, extractor_name='DefaultExtractor', backend_name=None) -> List[str]:
+    """
+    :param extractor_name: the name of the boilerpipe extractor (see blocks.EXTRACTORS).
+    :param backend_name: the backend to use, the current one (see use_backend) if not set.
+    :return: the text of the content blocks of the page :param url:.
+    """
+    if (backend_name or backend) == 'boilerpipe':
+        if Extractor is None:
+            raise ValueError("the boilerpipe backend is not available: boilerpipe is not installed")
+        return list(Extractor(extractor=extractor_name).getTextBlocks(url=url))
+    return extract_blocks(fetcher.fetch(url), extractor_name)
+
+
+def extract_blocks(html: str, extractor_name='DefaultExtractor') -> List[str]:
+    """
+    :param extractor_name: the name of the boilerpipe extractor (see blocks.EXTRACTORS).
+    :return: the text of the content blocks of :param html:, with the python backend.
+    """
+    if not html.strip():
+        return []
+    return blocks.extract_blocks(html, extractor_name)
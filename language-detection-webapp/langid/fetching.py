@@ -0,0 +1,315 @@
+"""
+Fetching of the pages to analyse, separated from the extraction of their text.
+
+Pages are downloaded through a pooled keep-alive session (see Fetcher), with timeouts and a size limit,
+and kept in a bounded HtmlCache (in memory and optionally on disk) along with their ETag/Last-Modified
+validators: analysing the same URL again, e.g. with another extractor or model, does not download it again.
+"""
+import codecs
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from os import path
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import chardet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+CachedPage = namedtuple('CachedPage', ['url', 'html', 'etag', 'last_modified', 'fetched'])
+
+_reg_meta_charset = re.compile(br"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+
+class HtmlCache:
+    """
+    LRU cache of the fetched pages (CachedPage), by URL. The pages are kept in memory up to
+    :param max_bytes:, and, if :param directory: is set, on disk up to :param max_disk_bytes:
+    (the oldest files being removed first), so that they survive restarts. All the methods are thread-safe.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, directory=None, max_disk_bytes=256 * 1024 * 1024):
+        """
+        :param max_bytes: the maximal (estimated) size of the pages in memory.
+        :param directory: the folder of the disk cache (created if needed), None to keep the pages in memory only.
+        :param max_disk_bytes: the maximal size of the disk cache.
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # url => (page, size), least recently used first
+        self._files = OrderedDict()  # file name => size, oldest first
+        self.nbytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._scan()
+
+    def get(self, url: str):
+        """ :return: the CachedPage of :param url:, None if it is not cached. """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                self.hits += 1
+                return entry[0]
+            page = self._read(url)
+            if page is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(page)
+            return page
+
+    def put(self, page: CachedPage):
+        """ Cache :param page: (replacing the previous version of its URL). """
+        with self._lock:
+            self._remember(page)
+            if self.directory is not None:
+                self._write(page)
+
+    def report(self) -> dict:
+        """ :return: the hits, misses and memory/disk usage of the cache. """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, entries=len(self._entries), nbytes=self.nbytes,
+                        max_bytes=self.max_bytes, files=len(self._files), disk_bytes=self.disk_bytes,
+                        max_disk_bytes=self.max_disk_bytes if self.directory is not None else None)
+
+    def clear(self):
+        """ Empty the cache (the disk cache included) and reset the statistics. """
+        with self._lock:
+            for name in self._files:
+                _remove(path.join(self.directory, name))
+            self._entries.clear()
+            self._files.clear()
+            self.nbytes = 0
+            self.disk_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    # -- private methods
+
+    def _remember(self, page):
+        if page.url in self._entries:
+            (_, size) = self._entries.pop(page.url)
+            self.nbytes -= size
+        size = sys.getsizeof(page.html)
+        if size > self.max_bytes:
+            return
+        self._entries[page.url] = (page, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            (_, (_, size)) = self._entries.popitem(last=False)
+            self.nbytes -= size
+
+    @staticmethod
+    def _file_name(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json'
+
+    def _scan(self):
+        names = [n for n in os.listdir(self.directory) if n.endswith('.json')]
+        stats = [(os.stat(path.join(self.directory, n)), n) for n in names]
+        for (stat, name) in sorted(stats, key=lambda t: t[0].st_mtime):
+            self._files[name] = stat.st_size
+            self.disk_bytes += stat.st_size
+
+    def _read(self, url):
+        if self.directory is None:
+            return None
+        name = self._file_name(url)
+        if name not in self._files:
+            return None
+        try:
+            with open(path.join(self.directory, name), encoding='utf-8') as f:
+                page = CachedPage(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            logger.warning("ignoring the unreadable cache file %s", name)
+            self.disk_bytes -= self._files.pop(name)
+            return None
+        return page if page.url == url else None
+
+    def _write(self, page):
+        name = self._file_name(page.url)
+        fpath = path.join(self.directory, name)
+        data = json.dumps(page._asdict()).encode('utf-8')
+        if len(data) > self.max_disk_bytes:
+            return
+        try:
+            # write then rename, so that readers never see a partial file
+            with open(fpath + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(fpath + '.tmp', fpath)
+        except OSError as e:
+            logger.warning("could not write the cache file %s: %s", name, e)
+            return
+        if name in self._files:
+            self.disk_bytes -= self._files.pop(name)
+        self._files[name] = len(data)
+        self.disk_bytes += len(data)
+        while self.disk_bytes > self.max_disk_bytes:
+            (old, size) = self._files.popitem(last=False)
+            self.disk_bytes -= size
+            _remove(path.join(self.directory, old))
+
+    def __repr__(self):
+        return "HtmlCache(max_bytes=%r, directory=%r, max_disk_bytes=%r)" % (
+            self.max_bytes, self.directory, self.max_disk_bytes)
+
+
+class Fetcher:
+    """
+    Download pages through pooled keep-alive connections, with timeouts and a size limit.
+    If the fetcher has an HtmlCache, the pages fetched less than :param ttl: seconds ago are served
+    from it, and the older ones are revalidated with a conditional request (ETag/Last-Modified),
+    which only downloads them again if they changed.
+
+    The fetcher is shared by the threads of the server: each thread gets its own requests.Session
+    (sessions are not thread-safe: their cookies and headers are shared state), and all the sessions
+    use the same HTTPAdapter, whose urllib3 connection pools are thread-safe.
+    """
+
+    def __init__(self, cache=None, ttl=600, timeout=(5, 20), max_bytes=8 * 1024 * 1024, pool_size=10,
+                 headers=DEFAULT_HEADERS):
+        """
+        :param cache: an HtmlCache, None to always download the pages.
+        :param ttl: the number of seconds a cached page is used without revalidation.
+        :param timeout: the connect and read timeouts, in seconds (see requests).
+        :param max_bytes: the maximal size of a page.
+        :param pool_size: the number of keep-alive connections kept per host.
+        :param headers: the headers sent with each request.
+        """
+        self.cache = cache
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.headers = dict(headers)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.downloads = 0
+        self.not_modified = 0
+        self.downloaded_bytes = 0
+
+    @property
+    def session(self) -> requests.Session:
+        """ The session of the current thread, created on first use. """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+        return session
+
+    def use_cache(self, cache, ttl=None):
+        """ Use the HtmlCache :param cache: (None to disable caching), and change the ttl if :param ttl: is set. """
+        self.cache = cache
+        if ttl is not None:
+            self.ttl = ttl
+
+    def fetch(self, url: str) -> str:
+        """
+        :return: the html of :param url:, decoded.
+        :raise ValueError: if the page is larger than max_bytes.
+        :raise requests.RequestException: if the page could not be downloaded.
+        """
+        with self._lock:
+            self.requests += 1
+        page = self.cache.get(url) if self.cache is not None else None
+        if page is not None and time.time() - page.fetched < self.ttl:
+            return page.html
+
+        headers = dict()
+        if page is not None:
+            if page.etag:
+                headers['If-None-Match'] = page.etag
+            if page.last_modified:
+                headers['If-Modified-Since'] = page.last_modified
+        response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        try:
+            if response.status_code == 304 and page is not None:
+                with self._lock:
+                    self.not_modified += 1
+                self.cache.put(page._replace(fetched=time.time()))
+                return page.html
+            response.raise_for_status()
+            content = self._read(url, response)
+        finally:
+            response.close()
+
+        html = content.decode(_encoding(response, content), errors='replace')
+        with self._lock:
+            self.downloads += 1
+            self.downloaded_bytes += len(content)
+        if self.cache is not None:
+            self.cache.put(CachedPage(url, html, response.headers.get('ETag'),
+                                      response.headers.get('Last-Modified'), time.time()))
+        return html
+
+    def report(self) -> dict:
+        """
+        :return: the number of pages requested, downloaded and revalidated (not modified), the bytes
+            downloaded and the statistics of the cache (if any).
+        """
+        with self._lock:
+            return dict(requests=self.requests, downloads=self.downloads, not_modified=self.not_modified,
+                        downloaded_bytes=self.downloaded_bytes,
+                        cache=self.cache.report() if self.cache is not None else None)
+
+    # -- private methods
+
+    def _read(self, url, response) -> bytes:
+        length = response.headers.get('Content-Length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            raise ValueError("%s: the page is too large (%s bytes, max %d)" % (url, length, self.max_bytes))
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(64 * 1024):
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ValueError("%s: the page is too large (max %d bytes)" % (url, self.max_bytes))
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def __repr__(self):
+        return "Fetcher(cache=%r, ttl=%r, timeout=%r, max_bytes=%r)" % (
+            self.cache, self.ttl, self.timeout, self.max_bytes)
+
+
+def _encoding(response, content: bytes) -> str:
+    """ :return: the charset of the Content-Type, else of the meta tags, else the detected one. """
+    candidates = []
+    if 'charset' in response.headers.get('Content-Type', '').lower():
+        candidates.append(response.encoding)
+    match = _reg_meta_charset.search(content[:4096])
+    if match is not None:
+        candidates.append(match.group(1).decode('ascii'))
+    for encoding in candidates:
+        try:
+            return codecs.lookup(encoding).name
+        except (LookupError, TypeError):
+            pass
+    return chardet.detect(content)['encoding'] or 'utf-8'
+
+
+def _remove(fpath):
+    try:
+        os.remove(fpath)
+    except OSError:
+        pass
+
+
+fetcher = Fetcher(HtmlCache())
@@ -1,5 +1,4 @@
-from boilerpipe.extract import Extractor
-
+from . import extraction
 from .models import models
 
 MODELS = list(models.keys())
@@ -24,11 +23,18 @@ def lang_of_text(text: str, model=MODELS[0], min_words=0, with_proba=False, retu
     return func(sentences, min_words=min_words, return_raw=return_raw)
 
 
+def text_blocks(url: str, extractor_name=EXTRACTORS[0]):
+    """
+    :return: the text blocks extracted from the page :param url: with the current extraction backend
+        (see extraction.py).
+    """
+    return extraction.text_blocks(url, extractor_name)
+
+
 def sentences_from_urls(url: str, extractor_name=EXTRACTORS[0], model=MODELS[0],
                         min_words=0, with_proba=False, return_raw=False):
-    extractor = Extractor(extractor=extractor_name)
     model = models[model]
-    extracted_text = extractor.getTextBlocks(url=url)
+    extracted_text = text_blocks(url, extractor_name)
     if len(extracted_text) > 0:
         func = model.predict_proba if with_proba else model.predict
         return func(extracted_text, min_words=min_words, return_raw=return_raw)
@@ -36,12 +42,12 @@ def sentences_from_urls(url: str, extractor_name=EXTRACTORS[0], model=MODELS[0],
 
 def mixed_sentences_from_urls(url: str, extractor_name=EXTRACTORS[0], model=MODELS[0],
                               min_words=0, with_proba=False, return_raw=False):
-    extractor = Extractor(extractor=extractor_name)
     model = models[model]
-    extracted_text = extractor.getTextBlocks(url=url)
+    extracted_text = text_blocks(url, extractor_name)
     if len(extracted_text) > 0:
-        func = model.predict_proba if with_proba else model.predict
+        # predict the sentences of all the blocks in one call
+        groups = model.predict_groups([ss.split("\n") for ss in extracted_text], min_words=min_words,
+                                      return_raw=return_raw, with_proba=with_proba)
         # ensure we don't return empty results
-        return [preds for preds in
-                (func(ss.split("\n"), min_words=min_words, return_raw=return_raw) for ss in extracted_text) if preds]
+        return [preds for preds in groups if preds]
     return []
@@ -1,46 +1,282 @@
+import logging
 import pickle
 import re
+import threading
+from collections import OrderedDict
 from os import path
 import numpy as np
 from typing import List, Tuple
 from .naive_identifier import NaiveIdentifier
+from .artifact import is_artifact, load_artifact
+from .batching import MicroBatcher
+from .compiled import CompiledPipeline, compile_pipeline, PRECISIONS
+from .sanitization import get_sanitizer, version_of
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_LABELS = ['de', 'fr', 'en', 'it', 'sg']
 
+_reg_spaces = re.compile(r"\s+")
+
+# the maximal number of characters predicted in one call by predict_groups (bounds the size of the document-term matrix)
+MAX_BATCH_CHARS = 1 << 20
+
+_pickles_dir = path.join(path.dirname(path.realpath(__file__)), '_pickles')
 
-class Model:
 
-    def __init__(self, model_name: str, description: str, labels=DEFAULT_LABELS, sanitizer=None):
+class Model:
 
-        with open(path.join(path.dirname(path.realpath(__file__)), '_pickles', model_name), 'br') as f:
-            self.pipe = pickle.load(f)
+    def __init__(self, model_name: str, description: str, labels=DEFAULT_LABELS, sanitizer=None, compiled=False,
+                 precision='float64', cache=None, batcher=None):
+        """
+        The pipeline is only loaded the first time it is used (see load). If an artifact exported
+        from the pickle exists (see artifact_path), it is used instead of the pickle.
 
+        :param sanitizer: the sanitizer version (see sanitization.SANITIZERS) or function. Pickles
+            saved with save_model record their version, which is used if this is not set and
+            must match it otherwise.
+        :param compiled: if set, serve the pipeline with a fused weight table (see compiled.py),
+            for vectorizer + linear classifier pipelines only (others are served as is, with a warning).
+        :param precision: the type of the weight table of compiled models (see compiled.PRECISIONS):
+            float32 and int8 tables are smaller, at the cost of some accuracy (see check_quantization.py).
+        :param cache: a PredictionCache for the predictions of the sanitized sentences, None to disable it.
+        :param batcher: a MicroBatcher predicting the sentences of concurrent calls together (see
+            batching.py and use_batching), None to predict each call on its own.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError("%s: unknown precision '%s'" % (model_name, precision))
+        if precision != 'float64' and not compiled:
+            raise ValueError("%s: the precision can only be set for compiled models" % model_name)
+        self.model_name = model_name
         self.description = description
         self.labels = labels
-        self._sanitizer = sanitizer or (lambda s: s)
+        self.sanitizer = sanitizer
+        self.compiled = compiled
+        self.precision = precision
+        self.cache = cache
+        self.batcher = batcher
+
+        self._pipe = None
+        self._sanitizer = None
+        self._loader = self.load
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return path.join(_pickles_dir, self.model_name)
+
+    @property
+    def artifact_path(self) -> str:
+        """ The memory-mappable artifact of the model (see artifact.export_artifact): foo.pickle => foo.artifact """
+        return path.splitext(self.path)[0] + '.artifact'
+
+    def exists(self) -> bool:
+        """ :return: True if the pickle or the artifact of the model is available. """
+        return path.exists(self.path) or is_artifact(self.artifact_path)
+
+    @property
+    def loaded(self) -> bool:
+        return self._pipe is not None
+
+    @property
+    def pipe(self):
+        return self.load()
+
+    def load(self):
+        """
+        Load the pipeline if it is not already in memory (thread-safe).
+        :return: the pipeline.
+        """
+        pipe = self._pipe
+        if pipe is not None:
+            return pipe
+        with self._lock:
+            if self._pipe is None:
+                pipe = self.read_pipeline()
+                if self.compiled:
+                    try:
+                        pipe = compile_pipeline(pipe, precision=self.precision)
+                    except ValueError as e:
+                        logger.warning("%s: cannot compile the pipeline, serving it as is: %s", self.model_name, e)
+                self._sanitizer = self._resolve_sanitizer(pipe)
+                self._pipe = pipe
+            return self._pipe
+
+    def read_pipeline(self):
+        """ :return: the pipeline read from disk (the artifact if it exists, the pickle otherwise), not compiled. """
+        if is_artifact(self.artifact_path):
+            return load_artifact(self.artifact_path)
+        with open(self.path, 'br') as f:
+            return pickle.load(f)
+
+    def use_loader(self, loader=None):
+        """
+        Get the pipeline from :param loader: (a function returning it, load if not set) when predicting.
+        The ModelRegistry sets its own, so that an evicted model is reloaded through its LRU.
+        """
+        self._loader = loader or self.load
+
+    def use_batching(self, max_wait=None, max_batch=256):
+        """
+        Predict the sentences of concurrent calls in batches of up to :param max_batch: sentences,
+        waiting at most :param max_wait: seconds for other calls (None to disable batching).
+        """
+        self.batcher = MicroBatcher(self._compute, max_wait, max_batch) if max_wait is not None else None
+
+    def unload(self):
+        """ Free the pipeline, which will be loaded again on the next use. """
+        with self._lock:
+            self._pipe = None
+
+    @staticmethod
+    def weights_of(pipe) -> str:
+        """ :return: the weights served by :param pipe:: 'pipeline', or 'compiled-<precision>' for a compiled one. """
+        return 'compiled-%s' % pipe.precision if isinstance(pipe, CompiledPipeline) else 'pipeline'
+
+    @property
+    def sanitizer_version(self):
+        """ The sanitizer version recorded in the pickle, or the one declared if the model is not loaded yet. """
+        return getattr(self._pipe, 'sanitizer_version', None) or \
+            (self.sanitizer if isinstance(self.sanitizer, str) else version_of(self.sanitizer))
+
+    def _resolve_sanitizer(self, pipe):
+        sanitizer = self.sanitizer
+        version = sanitizer if isinstance(sanitizer, str) else version_of(sanitizer)
+        recorded = getattr(pipe, 'sanitizer_version', None)
+        if recorded is not None and sanitizer is not None and version != recorded:
+            raise ValueError("%s: the model was trained with the sanitizer '%s', got '%s'" % (
+                self.model_name, recorded, version or sanitizer))
+        if (recorded or version) is not None:
+            # always serve the compiled implementation of the version
+            return get_sanitizer(recorded or version)
+        return sanitizer or (lambda s: s)
 
     # -- predictions
 
     def predict(self, sentences, min_words=0, return_raw=False) -> List[Tuple[str, int]]:
-        tup = self._preprocess(sentences, min_words)
-        if len(tup) > 0:
-            predicted = self.pipe.predict([t[1] for t in tup])
-            return list(zip(map(lambda t: t[not return_raw], tup), predicted))
-        return []
+        return self._predict(sentences, 'predict', min_words, return_raw)
 
     def predict_proba(self, sentences, min_words=0, return_raw=False) -> List[Tuple[str, int, List[np.float64]]]:
-        tup = self._preprocess(sentences, min_words)
-        if len(tup) > 0:
-            proba = self.pipe.predict_proba([t[1] for t in tup])
-            predicted = np.argmax(proba, axis=1).tolist()
-            return list(zip(map(lambda t: t[not return_raw], tup), predicted, proba))
-        return []
+        return self._predict(sentences, 'predict_proba', min_words, return_raw)
+
+    def predict_groups(self, groups, min_words=0, return_raw=False, with_proba=False,
+                       max_chars=MAX_BATCH_CHARS) -> List[list]:
+        """
+        Predict the sentences of all the :param groups: (e.g. the text blocks of a page) at once:
+        they are predicted in one call, or in chunks of about :param max_chars: characters to bound
+        the memory used by long pages.
+        :return: one list per group, with the results of predict (predict_proba if :param with_proba:
+            is set) for its sentences. Groups without any sentence left (see min_words) get an empty list.
+        """
+        groups = [g if hasattr(g, '__len__') else list(g) for g in groups]
+        ends = np.cumsum([len(g) for g in groups], dtype=np.int64)
+        (results, kept) = self._predict([s for g in groups for s in g], 'predict_proba' if with_proba else 'predict',
+                                        min_words, return_raw, max_chars, with_index=True)
+        # kept is sorted: split the results at the end of each group
+        bounds = np.searchsorted(kept, ends).tolist()
+        return [results[start:end] for (start, end) in zip([0] + bounds[:-1], bounds)]
 
     # -- private methods
 
-    def _preprocess(self, sentences, min_words=0) -> List[Tuple[str, str]]:
-        tup = [(s, self._sanitizer(s)) for s in sentences]
+    def _predict(self, sentences, kind: str, min_words=0, return_raw=False, max_chars=None, with_index=False):
+        """
+        :return: the results of predict or predict_proba (see :param kind:) for the sentences kept,
+            and their index in :param sentences: if :param with_index: is set.
+        """
+        pipe = self._loader()
+        (shown, sanitized, kept) = self._preprocess(sentences, min_words, return_raw)
+        results = []
+        if len(sanitized) > 0:
+            computed = np.concatenate([self._predictions(pipe, kind, sanitized[chunk])
+                                       for chunk in _chunks(sanitized, max_chars)])
+            if kind == 'predict_proba':
+                results = list(zip(shown, np.argmax(computed, axis=1).tolist(), computed))
+            else:
+                results = list(zip(shown, computed))
+        return (results, kept) if with_index else results
+
+    def _predictions(self, pipe, kind: str, sanitized: np.ndarray) -> np.ndarray:
+        """
+        :return: the result of pipe.<kind>(sanitized), only predicting the sentences missing
+            from the cache (in one batch) if the model has one.
+        """
+        cache = self.cache
+        if cache is None:
+            return self._run(pipe, kind, sanitized)
+
+        weights = self.weights_of(pipe)
+        keys = [cache.key(self.model_name, self.sanitizer_version, kind, s, weights) for s in sanitized]
+        values = cache.get_many(keys)
+        missing = [i for (i, v) in enumerate(values) if v is None]
+        if missing:
+            # predict each distinct sentence once
+            todo = OrderedDict()  # sentence => key
+            for i in missing:
+                todo.setdefault(sanitized[i], keys[i])
+            computed = self._run(pipe, kind, np.array(list(todo), dtype=object))
+            cache.put_many(list(todo.values()), [_readonly(v) for v in computed])
+            results = dict(zip(todo, computed))
+            for i in missing:
+                values[i] = results[sanitized[i]]
+        return np.array(values)
+
+    def _run(self, pipe, kind: str, sanitized: np.ndarray) -> np.ndarray:
+        batcher = self.batcher
+        if batcher is None:
+            return getattr(pipe, kind)(sanitized)
+        return batcher.run(kind, sanitized)
+
+    def _compute(self, kind: str, sanitized: np.ndarray) -> np.ndarray:
+        # called by the batcher: the pipeline may have been unloaded in the meantime
+        return getattr(self._loader(), kind)(sanitized)
+
+    def _preprocess(self, sentences, min_words=0, return_raw=False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sanitize all the :param sentences: in one pass and drop the ones with less than :param min_words: words.
+        :return: a tuple (shown, sanitized, kept) of arrays with the sentences kept, shown being the raw
+            sentences if :param return_raw: is set, the sanitized ones otherwise, and kept their index.
+        """
+        sentences = sentences if hasattr(sentences, '__len__') else list(sentences)
+        sanitized = np.array([self._sanitizer(s) for s in sentences], dtype=object)
         if min_words > 1:
-            return [t for t in tup if len(re.split(r"\s+", t[1])) >= min_words]
+            # the number of words is the number of whitespace runs + 1, as with len(re.split(r"\s+", s))
+            n_words = np.fromiter((len(_reg_spaces.findall(s)) + 1 for s in sanitized),
+                                  dtype=np.int64, count=sanitized.size)
+            index = np.flatnonzero(n_words >= min_words)
+            sanitized = sanitized[index]
         else:
-            return tup
+            index = np.arange(sanitized.size)
+        if return_raw:
+            raw = np.empty(len(sentences), dtype=object)
+            raw[:] = sentences
+            return raw[index], sanitized, index
+        return sanitized, sanitized, index
+
+
+def _chunks(sanitized: np.ndarray, max_chars=None) -> list:
+    """ :return: slices of :param sanitized: of about :param max_chars: characters each (at least one sentence). """
+    if max_chars is None:
+        return [slice(None)]
+    ends = np.cumsum(np.fromiter(map(len, sanitized), dtype=np.int64, count=sanitized.size))
+    bounds = np.searchsorted(ends, np.arange(max_chars, ends[-1], max_chars), side='right')
+    bounds = np.unique(np.concatenate([[0], bounds, [sanitized.size]]))
+    return [slice(start, end) for (start, end) in zip(bounds[:-1], bounds[1:])]
+
+
+def _readonly(value):
+    # the cached values are shared between the results: they must not be modified
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.flags.writeable = False
+    return value
+
+
+def save_model(pipe, model_name: str, sanitizer_version: str):
+    """
+    Pickle :param pipe: in the _pickles folder, recording the version of the sanitizer
+    its training data went through.
+    """
+    get_sanitizer(sanitizer_version)  # raise if unknown
+    pipe.sanitizer_version = sanitizer_version
+    with open(path.join(_pickles_dir, model_name), 'bw') as f:
+        pickle.dump(pipe, f)
@@ -1,49 +1,205 @@
+import functools
+import logging
+import threading
+from collections import OrderedDict
+
+from .compiled import PRECISIONS
 from .model import Model
 
-from .sanitization import sanitize_v0, sanitize_v1, sanitize_v2
-
-models = dict(
-    [(m.description, m) for m in [
-        Model(
-            model_name="Sanitize-CountVec_feat3000_1-3wordgrams-NaiveIdentifier.pickle",
-            description="NaiveIdentifier, CountVectorizer(1-3 wordgrams, 3000 features/lang)",
-            sanitizer=sanitize_v2
-        ),
-        Model(
-            model_name="Sanitize-CountVec_feat10000_1-3grams-MultinomialNB.pickle",
-            description="MultinomialNB, CountVectorizer(1-3 ngrams, 10000 features)",
-            sanitizer=sanitize_v2
-        ),
-        Model(
-            model_name="Sanitize-TfidfVec_feat10000_trigrams-logreg_C1.pickle",
-            description="LogisticRegression(C=1), TfidfVectorizer(trigrams, 10000 features, tfidf)",
-            sanitizer=sanitize_v2
-        ),
-        Model(
-            model_name="Sanitize-TfidfVec_feat10000_trigrams-SVM_linear_C1.pickle",
-            description="SVM(C=1, kernel=linear), TfidfVectorizer(trigrams, 10000 features, tfidf)",
-            sanitizer=sanitize_v2
-        ),
-        # # OLD MODELS
-        # Model(
-        #     model_name="model_3-5grams-sg-feat6000-tf-idf_logreg-V2.pickle",
-        #     description="NEW san, sg_only, vec(ngrams=(3,5),features=6'000,tf,if), logreg",
-        #     sanitizer=sanitize_v1
-        # ),
-        # Model(
-        #     model_name="model_trigrams-all-feat10000-tf-idf_logreg.pickle",
-        #     description="san, vec(ngrams=3,features=10'0000,tf,idf), logreg",
-        #     sanitizer=sanitize_v0
-        # ),
-        Model(
-            model_name="model_3-5grams-sg-feat6000-tf-idf_logreg.pickle",
-            description="OLD san, sg_only, vec(ngrams=(3,5),features=6'000,tf,if), logreg",
-            sanitizer=sanitize_v0
-        ),
-        # Model(
-        #     model_name="model_trigrams-all-feat10000-tf-idf_svc-liblinear-c1.pickle",
-        #     description="san, vec(ngrams=3,features=10'0000,tf,idf), svc(c=1, kernel=liblinear)",
-        #     sanitizer=sanitize_v0
-        # )
-
-    ]])
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    The models available, by description. Only the metadata is kept until a model is used: getting
+    a model (registry[description]) unpickles its pipeline if needed. At most :param max_resident:
+    pipelines are kept in memory, the least recently used being unloaded first.
+    Models whose pickle is missing are left out (with a warning).
+    """
+
+    def __init__(self, models, max_resident=None):
+        """
+        :param models: the Model instances (not loaded), at least one of them available.
+        :param max_resident: the maximal number of pipelines in memory, None for no limit.
+        :raise ValueError: if none of the models is available.
+        """
+        models = list(models)
+        self.max_resident = max_resident
+        self._models = OrderedDict()
+        for model in models:
+            if model.exists():
+                self._models[model.description] = model
+            else:
+                logger.warning("model '%s' left out: %s not found", model.description, model.path)
+        if not self._models:
+            raise ValueError("no model available: none of the pickles (or artifacts) of %s was found" %
+                             [model.model_name for model in models])
+        for (description, model) in self._models.items():
+            # predictions reload an evicted model through the LRU (see pipe)
+            model.use_loader(functools.partial(self.pipe, description))
+        self.cache = None
+        self._resident = OrderedDict()  # description => Model, least recently used first
+        self._lock = threading.Lock()
+
+    def keys(self):
+        return list(self._models.keys())
+
+    @property
+    def default(self) -> str:
+        """ The description of the default model (the first one). """
+        return next(iter(self._models))
+
+    def __iter__(self):
+        return iter(self._models)
+
+    def __len__(self):
+        return len(self._models)
+
+    def __contains__(self, description):
+        return description in self._models
+
+    def __getitem__(self, description) -> Model:
+        model = self._models[description]
+        self._load(model)
+        return model
+
+    def pipe(self, description):
+        """
+        :return: the pipeline of the model :param description:, loaded (and accounted for in the
+            LRU) like registry[description]. Holding it keeps it usable even if the model is evicted.
+        """
+        return self._load(self._models[description])
+
+    def peek(self, description) -> Model:
+        """ :return: the model :param description:, without loading it. """
+        return self._models[description]
+
+    def configure(self, max_resident=None):
+        """ Change the maximal number of pipelines in memory, unloading the extra ones. """
+        with self._lock:
+            self.max_resident = max_resident
+            self._evict()
+
+    def use_cache(self, cache):
+        """ Share the PredictionCache :param cache: between all the models (None to disable caching). """
+        self.cache = cache
+        for model in self._models.values():
+            model.cache = cache
+
+    def use_precision(self, precision='float64'):
+        """
+        Serve the weight tables of all the compiled models with :param precision: (see compiled.PRECISIONS),
+        unloading the ones already in memory. The lower precisions change the probabilities slightly
+        (see check_quantization.py).
+        """
+        if precision not in PRECISIONS:
+            raise ValueError("unknown precision '%s', expected one of %s" % (precision, PRECISIONS))
+        for model in self._models.values():
+            if model.compiled and model.precision != precision:
+                model.precision = precision
+                model.unload()
+
+    def use_batching(self, max_wait=None, max_batch=256):
+        """
+        Batch the predictions of concurrent requests, per model (see Model.use_batching).
+        :param max_wait: the maximal wait of a request in seconds, None to disable batching.
+        :param max_batch: the number of sentences triggering a batch immediately.
+        """
+        for model in self._models.values():
+            model.use_batching(max_wait, max_batch)
+
+    def report(self) -> dict:
+        """
+        :return: the models in memory, the statistics of the prediction cache (if any) and the
+            ones of the batchers of the models used so far (see MicroBatcher.report).
+        """
+        return dict(
+            resident=self.resident(),
+            cache=self.cache.report() if self.cache is not None else None,
+            batching=dict((d, m.batcher.report()) for (d, m) in self._models.items()
+                          if m.batcher is not None and m.batcher.requests > 0))
+
+    def preload(self, description=None, background=True):
+        """
+        Load the model :param description: (the default one if not set), in a daemon thread if
+        :param background: is set.
+        """
+        description = description or self.default
+        if not background:
+            self[description]
+            return None
+        thread = threading.Thread(target=self._preload, args=(description,), name='preload-model', daemon=True)
+        thread.start()
+        return thread
+
+    def resident(self):
+        """ :return: the descriptions of the models in memory, least recently used first. """
+        return [d for (d, m) in self._resident.items() if m.loaded]
+
+    # -- private methods
+
+    def _load(self, model):
+        # load before evicting, so that a model failing to load does not unload the others
+        pipe = model.load()
+        with self._lock:
+            self._resident[model.description] = model
+            self._resident.move_to_end(model.description)
+            self._evict()
+        return pipe
+
+    def _evict(self):
+        while self.max_resident is not None and len(self._resident) > max(self.max_resident, 1):
+            (_, model) = self._resident.popitem(last=False)
+            model.unload()
+
+    def _preload(self, description):
+        try:
+            self[description]
+        except Exception:
+            logger.exception("could not preload the model '%s'", description)
+
+
+models = ModelRegistry([
+    Model(
+        model_name="Sanitize-CountVec_feat3000_1-3wordgrams-NaiveIdentifier.pickle",
+        description="NaiveIdentifier, CountVectorizer(1-3 wordgrams, 3000 features/lang)",
+        sanitizer='v2'
+    ),
+    Model(
+        model_name="Sanitize-CountVec_feat10000_1-3grams-MultinomialNB.pickle",
+        description="MultinomialNB, CountVectorizer(1-3 ngrams, 10000 features)",
+        sanitizer='v2',
+        compiled=True
+    ),
+    Model(
+        model_name="Sanitize-TfidfVec_feat10000_trigrams-logreg_C1.pickle",
+        description="LogisticRegression(C=1), TfidfVectorizer(trigrams, 10000 features, tfidf)",
+        sanitizer='v2'
+    ),
+    Model(
+        model_name="Sanitize-TfidfVec_feat10000_trigrams-SVM_linear_C1.pickle",
+        description="SVM(C=1, kernel=linear), TfidfVectorizer(trigrams, 10000 features, tfidf)",
+        sanitizer='v2'
+    ),
+    # # OLD MODELS
+    # Model(
+    #     model_name="model_3-5grams-sg-feat6000-tf-idf_logreg-V2.pickle",
+    #     description="NEW san, sg_only, vec(ngrams=(3,5),features=6'000,tf,if), logreg",
+    #     sanitizer='v1'
+    # ),
+    # Model(
+    #     model_name="model_trigrams-all-feat10000-tf-idf_logreg.pickle",
+    #     description="san, vec(ngrams=3,features=10'0000,tf,idf), logreg",
+    #     sanitizer='v0'
+    # ),
+    Model(
+        model_name="model_3-5grams-sg-feat6000-tf-idf_logreg.pickle",
+        description="OLD san, sg_only, vec(ngrams=(3,5),features=6'000,tf,if), logreg",
+        sanitizer='v0'
+    ),
+    # Model(
+    #     model_name="model_trigrams-all-feat10000-tf-idf_svc-liblinear-c1.pickle",
+    #     description="san, vec(ngrams=3,features=10'0000,tf,idf), svc(c=1, kernel=liblinear)",
+    #     sanitizer='v0'
+    # )
+])
@@ -0,0 +1 @@
+../../language-detection/langid/parallel.py
\ No newline at end of file
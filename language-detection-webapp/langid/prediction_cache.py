@@ -0,0 +1,109 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """
+    LRU cache of the predictions of the models, per sanitized sentence, so that recurring texts
+    (menus, cookie banners, footers...) are only predicted once. The entries expire after
+    :param ttl: seconds, and the least recently used ones are evicted beyond :param max_bytes:.
+
+    The same instance can be shared by several models: the keys hold the model name, the
+    sanitizer version and the weights served (e.g. a quantized table). All the methods are thread-safe.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=None):
+        """
+        :param max_bytes: the maximal (estimated) size of the entries.
+        :param ttl: the lifetime of the entries in seconds, None for no expiration.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.clear()
+
+    @staticmethod
+    def key(model_name: str, sanitizer_version, kind: str, sanitized: str, weights=None) -> tuple:
+        """
+        :param kind: the prediction, e.g. 'predict' or 'predict_proba'.
+        :param weights: the weights the model serves, e.g. 'compiled-int8' (see Model.weights_of), so that
+            the predictions of a pipeline are not served for another precision of its weight table.
+        :return: the key of the prediction of :param sanitized:.
+        """
+        digest = hashlib.blake2b(sanitized.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        return model_name, sanitizer_version, weights, kind, digest
+
+    def get_many(self, keys) -> list:
+        """
+        :return: the value of each key, None for the ones missing or expired.
+        """
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl is not None and now - entry[2] > self.ttl:
+                    self._discard(key)
+                    self.expired += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    values.append(entry[0])
+        return values
+
+    def put_many(self, keys, values):
+        """ Cache the :param values: under :param keys:. """
+        now = time.monotonic()
+        with self._lock:
+            for (key, value) in zip(keys, values):
+                size = sys.getsizeof(key) + sum(map(sys.getsizeof, key)) + _sizeof(value)
+                if size > self.max_bytes:
+                    continue
+                if key in self._entries:
+                    self._discard(key)
+                self._entries[key] = (value, size, now)
+                self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                (_, (_, size, _)) = self._entries.popitem(last=False)
+                self.nbytes -= size
+
+    def report(self) -> dict:
+        """
+        :return: the hits, misses (expired entries included), expired entries and memory usage of the cache.
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, expired=self.expired, entries=len(self._entries),
+                        nbytes=self.nbytes, max_bytes=self.max_bytes, ttl=self.ttl)
+
+    def clear(self):
+        """ Empty the cache and reset the statistics. """
+        with self._lock:
+            self._entries = OrderedDict()  # key => (value, size, time), least recently used first
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.expired = 0
+
+    # -- private methods
+
+    def _discard(self, key):
+        (_, size, _) = self._entries.pop(key)
+        self.nbytes -= size
+
+    def __repr__(self):
+        return "PredictionCache(max_bytes=%r, ttl=%r)" % (self.max_bytes, self.ttl)
+
+
+def _sizeof(value) -> int:
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (0 if value.base is None else value.nbytes)
+    return sys.getsizeof(value)
@@ -1,4 +1,6 @@
 import re
+import signal
+import time
 
 reg_nonletters_v0 = re.compile("[^\w \.,]|\d|_")
 
@@ -60,4 +62,188 @@ def sanitize_v2(text: str) -> str:
     return text.strip()
 
 # from alphabet_detector import AlphabetDetector
-# ad = AlphabetDetector()
\ No newline at end of file
+# ad = AlphabetDetector()
+
+# ----------
+# sanitizer of the langid microservice (data-gathering/langid-microservice/langrpc/langid)
+
+reg_nonletters_rpc = re.compile("[^\w \.,]|\d|_")
+
+def sanitize_rpc(txt: str) -> str:
+    txt = txt.lower()
+    txt = re.sub(reg_nonletters_rpc, "", txt)
+    txt = re.sub(" +", " ", txt)
+    txt = re.sub(" \.", ".", txt)
+    return txt.strip()
+
+# ==========================
+#  compiled sanitizers
+# ==========================
+# Each sanitizer above is compiled into a single scan of the text, giving the exact same output.
+
+
+class _Translation(dict):
+    """
+    A str.translate table mapping each character matching :param reg: to :param replacement:,
+    filled lazily as new characters are seen.
+    """
+
+    def __init__(self, reg, replacement, extra=None):
+        super().__init__(extra or {})
+        self.reg = reg
+        self.replacement = replacement
+
+    def __missing__(self, code):
+        value = self[code] = self.replacement if self.reg.match(chr(code)) else code
+        return value
+
+
+_translation_v0 = _Translation(reg_nonletters_v0, " ")
+_translation_v1 = _Translation(reg_nonletters_v1, " ", {ord("’"): "'"})
+_translation_rpc = _Translation(reg_nonletters_rpc, None)
+
+# the characters replaced by a space in v2, and by a single space once the spaces are collapsed
+_runs_v2 = re.compile(r"[\W\d_]+")
+
+
+def compiled_v0(text: str) -> str:
+    # only single spaces are left after the translation, so split/join collapses them and strips
+    return ' '.join(text.lower().translate(_translation_v0).split())
+
+
+def compiled_v2(text: str) -> str:
+    return _runs_v2.sub(' ', text).strip()
+
+
+def compiled_rpc(text: str) -> str:
+    return ' '.join(text.lower().translate(_translation_rpc).split()).replace(' .', '.')
+
+
+# After the v1 translation, all the other steps of sanitize_v1 only modify runs of non letters
+# ([\W_]), without crossing letters. A run of one character in the middle of the text is never
+# modified, the others are sanitized on their own (see _sanitize_run_v1) and memoized.
+_runs_v1 = re.compile(r"[\W_]{2,}|\A[\W_]|[\W_]\Z")
+_lost_v1 = re.compile(r"([^\w]|[, \.])'([^\w]|[, \.])")
+_leading_v1 = re.compile(r"\A\W+")
+_last_dot_v1 = re.compile(r"[\.,][^\.,]*\Z")
+_dots_v1 = re.compile(r"[,\.][,\.]+")
+_spaces_v1 = re.compile(r"\s+")
+_memo_v1 = dict()
+
+
+def _sanitize_run_v1(run: str, at_start: bool, at_end: bool) -> str:
+    run = _lost_v1.sub(r"\1\2", run)
+    if at_start:
+        run = _leading_v1.sub("", run)
+    # ([^\w]|[_, ])+([\.,]+) => \2 keeps a run from its last dot or comma, if not its first character
+    # (the regex itself backtracks exponentially on long runs without dots)
+    last = _last_dot_v1.search(run, 1)
+    if last is not None:
+        run = run[last.start():]
+    run = _dots_v1.sub(".", run)
+    run = _spaces_v1.sub(" ", run)
+    if at_start:
+        run = run.lstrip()
+    if at_end:
+        run = run.rstrip()
+    return run
+
+
+def _replace_run_v1(match) -> str:
+    key = (match.group(), match.start() == 0, match.end() == len(match.string))
+    run = _memo_v1.get(key)
+    if run is None:
+        if len(_memo_v1) > 100000:
+            _memo_v1.clear()
+        run = _memo_v1[key] = _sanitize_run_v1(*key)
+    return run
+
+
+def compiled_v1(text: str) -> str:
+    return _runs_v1.sub(_replace_run_v1, text.translate(_translation_v1))
+
+
+# ==========================
+#  registry
+# ==========================
+
+# version => (reference implementation, compiled implementation)
+# note: the sanitize function of language-detection/langid/sanitization.py is v2
+SANITIZERS = dict(
+    v0=(sanitize_v0, compiled_v0),
+    v1=(sanitize_v1, compiled_v1),
+    v2=(sanitize_v2, compiled_v2),
+    rpc=(sanitize_rpc, compiled_rpc),
+)
+
+
+def get_sanitizer(version: str, compiled=True):
+    """
+    :return: the sanitizer function of :param version:, the compiled implementation by default.
+    """
+    if version not in SANITIZERS:
+        raise ValueError("unknown sanitizer version '%s', should be one of %s" % (version, list(SANITIZERS)))
+    return SANITIZERS[version][1 if compiled else 0]
+
+
+def version_of(sanitizer):
+    """
+    :return: the version of :param sanitizer: (a reference or compiled implementation), None if
+        it is not part of the registry.
+    """
+    for (version, functions) in SANITIZERS.items():
+        if sanitizer in functions:
+            return version
+    return None
+
+
+def check_sanitizers(texts, versions=None, timeout=1.0) -> dict:
+    """
+    Check that the compiled implementation of each version gives the same output as the reference
+    implementation on all the :param texts:.
+
+    :param versions: the versions to check, all by default.
+    :param timeout: the maximal time in seconds allowed to the reference implementation for one
+        text (sanitize_v1 backtracks exponentially on some texts). Texts exceeding it are skipped.
+        It requires signal.setitimer (unix only), set to None to disable.
+    :return: a dict version => dict(checked, skipped, mismatches, reference_seconds, compiled_seconds),
+        mismatches being a list of (text, expected, actual).
+    """
+    def on_timeout(*args):
+        raise TimeoutError()
+
+    use_timer = timeout is not None and hasattr(signal, 'setitimer')
+    if use_timer:
+        previous_handler = signal.signal(signal.SIGALRM, on_timeout)
+
+    results = dict()
+    try:
+        for version in versions or SANITIZERS.keys():
+            (reference, compiled) = SANITIZERS[version]
+            res = results[version] = dict(checked=0, skipped=0, mismatches=[],
+                                          reference_seconds=0.0, compiled_seconds=0.0)
+            for text in texts:
+                start = time.perf_counter()
+                try:
+                    if use_timer:
+                        signal.setitimer(signal.ITIMER_REAL, timeout)
+                    expected = reference(text)
+                except TimeoutError:
+                    res['skipped'] += 1
+                    continue
+                finally:
+                    if use_timer:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                res['reference_seconds'] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                actual = compiled(text)
+                res['compiled_seconds'] += time.perf_counter() - start
+
+                res['checked'] += 1
+                if actual != expected:
+                    res['mismatches'].append((text, expected, actual))
+    finally:
+        if use_timer:
+            signal.signal(signal.SIGALRM, previous_handler)
+    return results
@@ -2,6 +2,10 @@ from flask import Flask
 import click 
 
 from blueprints.langid import blueprint_langid
+from langid.models import models
+from langid.compiled import PRECISIONS
+from langid.prediction_cache import PredictionCache
+from langid.fetching import fetcher, HtmlCache
 
 app = Flask(__name__)
 app.config.update(dict(
@@ -38,10 +42,46 @@ def init_app():
 @click.option('--debug', '-d', default=False, is_flag=True, help="If set, launch Flask in DEBUG mode.")
 @click.option('--host', '-h', default="localhost",  help="Listen address.")
 @click.option('--port', '-p', default=8080, type=int, help="Listen port.")
-def run(debug, host, port):
+@click.option('--max-models', '-m', default=0, type=int,
+              help="Maximum number of models kept in memory (least recently used are unloaded), 0 for no limit.")
+@click.option('--preload/--no-preload', default=True,
+              help="Load the default model in the background at startup (default) or on the first request.")
+@click.option('--cache-size', default=64, type=int,
+              help="Memory limit of the prediction cache in MB, 0 to disable it.")
+@click.option('--cache-ttl', default=3600, type=int,
+              help="Lifetime of the cached predictions in seconds, 0 for no expiration.")
+@click.option('--batch-wait', default=0, type=float,
+              help="Gather the sentences of concurrent requests for up to this many milliseconds "
+                   "and predict them together, 0 to disable batching.")
+@click.option('--batch-size', default=256, type=int,
+              help="Number of sentences triggering a batch before the end of --batch-wait.")
+@click.option('--precision', default=None, type=click.Choice(PRECISIONS),
+              help="Type of the weight tables of all the compiled models (the one of langid/models.py by default): "
+                   "float32 and int8 use less memory, but change the probabilities slightly (see check_quantization.py).")
+@click.option('--html-cache-size', default=32, type=int,
+              help="Memory limit of the cache of the fetched pages in MB, 0 to disable it.")
+@click.option('--html-cache-dir', default=None, type=click.Path(file_okay=False),
+              help="Also keep the fetched pages in this folder (bounded to 256 MB), across restarts.")
+@click.option('--html-cache-ttl', default=600, type=int,
+              help="Number of seconds a fetched page is reused before being revalidated (ETag/Last-Modified).")
+@click.option('--fetch-timeout', default=20, type=float, help="Read timeout when fetching a page, in seconds.")
+def run(debug, host, port, max_models, preload, cache_size, cache_ttl, batch_wait, batch_size, precision,
+        html_cache_size, html_cache_dir, html_cache_ttl, fetch_timeout):
     if debug:
         app.config['TEMPLATES_AUTO_RELOAD'] = True
 
+    models.configure(max_resident=max_models or None)
+    if cache_size > 0:
+        models.use_cache(PredictionCache(max_bytes=cache_size * 1024 * 1024, ttl=cache_ttl or None))
+    if batch_wait > 0:
+        models.use_batching(max_wait=batch_wait / 1000, max_batch=batch_size)
+    if precision:
+        models.use_precision(precision)
+    fetcher.use_cache(HtmlCache(max_bytes=html_cache_size * 1024 * 1024, directory=html_cache_dir)
+                      if html_cache_size > 0 or html_cache_dir else None, ttl=html_cache_ttl)
+    fetcher.timeout = (fetcher.timeout[0], fetch_timeout)
+    if preload:
+        models.preload()
     init_app()
     app.run(host=host, port=port, debug=debug)
 
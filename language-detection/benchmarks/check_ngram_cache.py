@@ -0,0 +1,59 @@
+"""
+Check that a WrappedVectorizer using an NgramCountCache builds the same vocabulary and
+document-term matrix as a plain TfidfVectorizer, for the char, char_wb and word analyzers
+and several ngram ranges (the candidates of a grid search sharing the cache).
+
+The corpus is made of sentences found in the `data` folder.
+Usage (from the language-detection folder):
+
+    python benchmarks/check_ngram_cache.py
+"""
+import glob
+import io
+import os
+import sys
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from langid import WrappedVectorizer, NgramCountCache
+
+_datadir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'data')
+
+CANDIDATES = [
+    dict(analyzer='char', ngram_range=(1, 3), max_features=5000),
+    dict(analyzer='char', ngram_range=(2, 4), sublinear_tf=True),
+    dict(analyzer='char_wb', ngram_range=(1, 3), max_features=5000),
+    dict(analyzer='char_wb', ngram_range=(2, 5), min_df=2),
+    dict(analyzer='word', ngram_range=(1, 1)),
+    dict(analyzer='word', ngram_range=(1, 3), max_features=10000, binary=True),
+]
+
+
+def load_corpus(n_per_file=400):
+    sentences = []
+    for fpath in sorted(glob.glob(os.path.join(_datadir, 'valid_*.txt'))):
+        sentences += [line.strip() for line in io.open(fpath, encoding="utf-8")][:n_per_file]
+    return sentences
+
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    (train, test) = (corpus[::2], corpus[1::2])
+    print("corpus: %d train, %d test sentences" % (len(train), len(test)))
+
+    cache = NgramCountCache()
+    failed = False
+    for params in CANDIDATES:
+        reference = TfidfVectorizer(**params).fit(train)
+        wrapped = WrappedVectorizer(ngram_cache=cache, **params)
+        wrapped.fit(train)
+        same_vocabulary = wrapped.vectorizer.vocabulary_ == reference.vocabulary_
+        diff = abs(wrapped.transform(test) - reference.transform(test)).max() if same_vocabulary else float('nan')
+        ok = same_vocabulary and diff < 1e-12
+        failed |= not ok
+        print("%-70s vocabulary %5s  max diff %.2e  %s" % (
+            ", ".join("%s=%r" % t for t in sorted(params.items())), same_vocabulary, diff, "ok" if ok else "MISMATCH"))
+
+    print("cache: %s" % cache.report())
+    sys.exit(1 if failed else 0)
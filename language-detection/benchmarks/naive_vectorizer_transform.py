@@ -0,0 +1,69 @@
+"""
+Compare the batch NaiveVectorizer.transform with the legacy implementation
+(one csr_matrix per row joined with vstack).
+
+The corpus is made of all the sentences found in the `data` folder.
+Usage (from the language-detection folder):
+
+    python benchmarks/naive_vectorizer_transform.py
+"""
+import glob
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from scipy.sparse.linalg import norm as scipy_norm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from langid import NaiveVectorizer
+
+_datadir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'data')
+
+
+def load_corpus():
+    sentences = []
+    for fpath in sorted(glob.glob(os.path.join(_datadir, '*.txt'))):
+        sentences += [line.strip() for line in io.open(fpath, encoding="utf-8")]
+    return sentences
+
+
+def legacy_transform(nv: NaiveVectorizer, dataset):
+    """ The transform implementation prior to the batch csr matrix. """
+    def transform_row(d):
+        d_grams = nv._ngrams_range(d, nv.nrange, nv._features)
+        if len(d_grams) == 0:
+            return csr_matrix((1, nv._feature_names.size), dtype=np.float64)
+        (uniq, freqs) = np.unique(d_grams, return_counts=True)
+        vec = 1 + np.log(np.array(freqs))
+        idx = np.array([nv._features[k][1] for k in uniq])
+        mat = csr_matrix((vec, ([0] * vec.size, idx)), shape=(1, nv._feature_names.size))
+        return mat / scipy_norm(mat)
+
+    return vstack(np.vectorize(transform_row)(dataset)).tocsr()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    print("corpus: %d sentences" % len(corpus))
+
+    nv = NaiveVectorizer(ngram_range=(3, 5), max_features=3000)
+    _, fit_time = timed(nv.fit, corpus)
+    print("fit:              %8.2f s" % fit_time)
+
+    legacy, legacy_time = timed(legacy_transform, nv, corpus)
+    batch, batch_time = timed(nv.transform, corpus)
+    print("legacy transform: %8.2f s" % legacy_time)
+    print("batch transform:  %8.2f s  (x%.1f)" % (batch_time, legacy_time / batch_time))
+
+    same = batch.shape == legacy.shape and abs(batch - legacy).max() < 1e-12
+    print("same matrix:      %s" % same)
+    sys.exit(0 if same else 1)
@@ -0,0 +1,254 @@
+"""
+Benchmark suite for the langid package.
+
+Each case (vectorizers, identifier, sanitization) runs on bundled corpora (sentences from the
+`data` folder) and generated corpora (random sentences made of words from the bundled corpora)
+of several sizes, offline. For each run, the suite records:
+
+ - the throughput, in sentences per second, of the whole batch;
+ - the p50/p99 latency per sentence, calling the operation on one sentence at a time
+   (not available for fit);
+ - the peak RSS of the process running the case (each case runs in its own process).
+
+Results are written to a JSON file, and can be compared against a previous run (the baseline):
+the suite exits with an error if a run is slower or uses more memory than the baseline beyond
+the tolerance. `benchmarks/baseline.json` holds the results of a reference run (its `meta`
+tells on which machine): regenerate it on your own machine before comparing against it.
+
+Usage (from the language-detection folder):
+
+    python benchmarks/suite.py -o benchmarks/baseline.json
+    python benchmarks/suite.py -b benchmarks/baseline.json --tolerance 0.25
+    python benchmarks/suite.py --cases NaiveIdentifier.predict --sizes 1000
+"""
+import argparse
+import glob
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import random
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from langid import NaiveVectorizer, NaiveIdentifier, WrappedVectorizer, sanitize, np_sanitize
+
+_datadir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'data')
+langs = ['de', 'fr', 'en', 'it', 'sg']
+
+# ==========================
+#  corpora
+# ==========================
+
+
+def bundled_corpus(size: int, seed=0):
+    """
+    :return: (X, y), :param size: sentences evenly taken from the training files of each language.
+    """
+    rnd = random.Random(seed)
+    X, y = [], []
+    for (i, lang) in enumerate(langs):
+        lines = [line.strip() for line in io.open(os.path.join(_datadir, '%s.txt' % lang), encoding="utf-8")]
+        n = size // len(langs) + (1 if i < size % len(langs) else 0)
+        X += [rnd.choice(lines) for _ in range(n)] if n > len(lines) else rnd.sample(lines, n)
+        y += [i] * n
+    return X, y
+
+
+def generated_corpus(size: int, seed=0, min_words=3, max_words=40):
+    """
+    :return: (X, y), :param size: random sentences, each made of words drawn from the
+        bundled sentences of one language.
+    """
+    rnd = random.Random(seed)
+    words = [
+        [w for line in io.open(os.path.join(_datadir, '%s.txt' % lang), encoding="utf-8") for w in line.split()]
+        for lang in langs]
+    y = [i % len(langs) for i in range(size)]
+    X = [" ".join(rnd.choice(words[i]) for _ in range(rnd.randint(min_words, max_words))) for i in y]
+    return X, y
+
+
+CORPORA = dict(bundled=bundled_corpus, generated=generated_corpus)
+
+# ==========================
+#  cases
+# ==========================
+# a case receives the corpus and returns (batch, single): batch() processes the whole corpus,
+# single(x) processes one sentence (None if it makes no sense, e.g. for fit)
+
+
+def naive_vectorizer_fit(X, y):
+    return (lambda: NaiveVectorizer(max_features=3000).fit(X)), None
+
+
+def naive_vectorizer_transform(X, y):
+    nv = NaiveVectorizer(max_features=3000)
+    nv.fit(X)
+    return (lambda: nv.transform(X)), (lambda x: nv.transform([x]))
+
+
+def naive_identifier_fit(X, y):
+    return (lambda: NaiveIdentifier().fit(X, y)), None
+
+
+def naive_identifier_predict(X, y):
+    ni = NaiveIdentifier().fit(X, y)
+    return (lambda: ni.predict(X)), (lambda x: ni.predict([x]))
+
+
+def naive_identifier_predict_proba(X, y):
+    ni = NaiveIdentifier().fit(X, y)
+    return (lambda: ni.predict_proba(X)), (lambda x: ni.predict_proba([x]))
+
+
+def wrapped_vectorizer_fit(X, y):
+    return (lambda: WrappedVectorizer(np_sanitize, analyzer='char', ngram_range=(1, 3)).fit(X, y)), None
+
+
+def wrapped_vectorizer_transform(X, y):
+    wv = WrappedVectorizer(np_sanitize, analyzer='char', ngram_range=(1, 3))
+    wv.fit(X, y)
+    return (lambda: wv.transform(X)), (lambda x: wv.transform([x]))
+
+
+def sanitize_case(X, y):
+    return (lambda: [sanitize(x) for x in X]), sanitize
+
+
+def np_sanitize_case(X, y):
+    return (lambda: np_sanitize(X)), (lambda x: np_sanitize([x]))
+
+
+CASES = {
+    'NaiveVectorizer.fit': naive_vectorizer_fit,
+    'NaiveVectorizer.transform': naive_vectorizer_transform,
+    'NaiveIdentifier.fit': naive_identifier_fit,
+    'NaiveIdentifier.predict': naive_identifier_predict,
+    'NaiveIdentifier.predict_proba': naive_identifier_predict_proba,
+    'WrappedVectorizer.fit': wrapped_vectorizer_fit,
+    'WrappedVectorizer.transform': wrapped_vectorizer_transform,
+    'sanitize': sanitize_case,
+    'np_sanitize': np_sanitize_case,
+}
+
+# ==========================
+#  running
+# ==========================
+
+
+def measure(case: str, corpus: str, size: int, n_latency=200) -> dict:
+    """
+    Run one case on one corpus in the current process.
+    """
+    (X, y) = CORPORA[corpus](size)
+    (batch, single) = CASES[case](X, y)
+
+    start = time.perf_counter()
+    batch()
+    seconds = time.perf_counter() - start
+
+    result = dict(seconds=seconds, throughput=len(X) / seconds, p50_ms=None, p99_ms=None)
+    if single is not None:
+        latencies = []
+        for x in X[:n_latency]:
+            start = time.perf_counter()
+            single(x)
+            latencies.append((time.perf_counter() - start) * 1000)
+        result['p50_ms'] = float(np.percentile(latencies, 50))
+        result['p99_ms'] = float(np.percentile(latencies, 99))
+
+    # ru_maxrss is in kilobytes on linux, in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return result
+
+
+def _measure_child(queue, *args):
+    queue.put(measure(*args))
+
+
+def measure_isolated(*args) -> dict:
+    """
+    Run :func:measure in a new process, so that the peak RSS only accounts for this case.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure_child, args=(queue, *args))
+    process.start()
+    try:
+        while True:
+            try:
+                return queue.get(timeout=1)
+            except queue_module.Empty:
+                if not process.is_alive():
+                    raise RuntimeError("the benchmark process of %s died (exit code %s)" % (
+                        "/".join(map(str, args)), process.exitcode))
+    finally:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :return: the list of regressions (human readable) of :param results: against :param baseline:
+    """
+    regressions = []
+    for (key, res) in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if res['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append("%s: throughput %.1f/s < %.1f/s" % (key, res['throughput'], base['throughput']))
+        for metric in ['p99_ms', 'peak_rss_mb']:
+            if res.get(metric) is not None and base.get(metric) is not None \
+                    and res[metric] > base[metric] * (1 + tolerance):
+                regressions.append("%s: %s %.2f > %.2f" % (key, metric, res[metric], base[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the langid vectorizers, identifiers and sanitizers.")
+    parser.add_argument('-o', '--output', default='benchmark-results.json', help="Where to write the results.")
+    parser.add_argument('-b', '--baseline', help="A previous results file to compare with.")
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help="Maximal relative regression allowed against the baseline.")
+    parser.add_argument('--cases', nargs='+', default=list(CASES.keys()), choices=list(CASES.keys()))
+    parser.add_argument('--corpora', nargs='+', default=list(CORPORA.keys()), choices=list(CORPORA.keys()))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000])
+    args = parser.parse_args()
+
+    results = dict()
+    for case in args.cases:
+        for corpus in args.corpora:
+            for size in args.sizes:
+                key = "%s/%s/%d" % (case, corpus, size)
+                results[key] = res = measure_isolated(case, corpus, size)
+                print("%-50s %10.1f sentences/s  p50 %s  p99 %s  rss %7.1f MB" % (
+                    key, res['throughput'],
+                    "-" if res['p50_ms'] is None else "%.3f ms" % res['p50_ms'],
+                    "-" if res['p99_ms'] is None else "%.3f ms" % res['p99_ms'],
+                    res['peak_rss_mb']))
+
+    with open(args.output, 'w') as f:
+        json.dump(dict(
+            meta=dict(python=platform.python_version(), machine=platform.machine(), time=time.time()),
+            results=results), f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for r in regressions:
+            print("REGRESSION %s" % r)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 from .wrapped_vectorizer import WrappedVectorizer
 from .naive_identifier import NaiveIdentifier
 from .naive_vectorizer import NaiveVectorizer
-from .sanitization import sanitize, np_sanitize
\ No newline at end of file
+from .sanitization_cache import SanitizationCache
+from .ngram_cache import NgramCountCache
+from .sanitization import sanitize, sanitize_all, np_sanitize
\ No newline at end of file
@@ -0,0 +1,125 @@
+import io
+import mmap
+import os
+import numpy as np
+
+# files of a corpus store (a folder)
+_TEXT, _OFFSETS, _LABELS = 'text.bin', 'offsets.npy', 'labels.npy'
+
+
+def build_corpus(fpaths, labels, directory):
+    """
+    Create a corpus store from text files (one sentence per line, stripped as the notebooks do):
+     - text.bin: the utf-8 sentences, separated by a newline;
+     - offsets.npy: the byte offset of each sentence in text.bin, plus the total size;
+     - labels.npy: the label of each sentence.
+
+    :param fpaths: the text files.
+    :param labels: the label of the sentences of each file.
+    :param directory: the folder of the store (created if needed).
+    """
+    os.makedirs(directory, exist_ok=True)
+    offsets, y, size = [0], [], 0
+    with open(os.path.join(directory, _TEXT), 'wb') as out:
+        for (fpath, label) in zip(fpaths, labels):
+            with io.open(fpath, encoding="utf-8") as f:
+                lines = [line.strip().encode('utf-8') + b'\n' for line in f]
+            out.write(b''.join(lines))
+            for line in lines:
+                size += len(line)
+                offsets.append(size)
+            y += [label] * len(lines)
+    np.save(os.path.join(directory, _OFFSETS), np.array(offsets, dtype=np.int64))
+    np.save(os.path.join(directory, _LABELS), np.array(y))
+
+
+def is_stale(directory, fpaths) -> bool:
+    """
+    :return: True if the store in :param directory: is missing or older than one of :param fpaths:.
+    """
+    lpath = os.path.join(directory, _LABELS)
+    if not os.path.exists(lpath):
+        return True
+    built = os.path.getmtime(lpath)
+    return any(os.path.getmtime(fpath) > built for fpath in fpaths)
+
+
+def load_corpus(directory):
+    """
+    Open a corpus store created by :func:build_corpus.
+    :return: (X, y), X being a lazy CorpusView of all the sentences and y the labels.
+    """
+    with open(os.path.join(directory, _TEXT), 'rb') as f:
+        # mmap cannot map empty files
+        text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size > 0 else b''
+    offsets = np.load(os.path.join(directory, _OFFSETS), mmap_mode='r')
+    labels = np.load(os.path.join(directory, _LABELS))
+    return CorpusView(directory, text, offsets, slice(0, len(labels))), labels
+
+
+class CorpusView:
+    """
+    A read-only sequence of sentences backed by a corpus store (see build_corpus): sentences
+    are only decoded when accessed. Indexing with a slice, a boolean mask or an array of indices
+    returns a new view, without copying any sentence.
+    """
+
+    def __init__(self, directory, text, offsets, index):
+        self.directory = directory
+        self._text = text
+        self._offsets = offsets
+        # a slice (with step 1) or an array of indices in the store
+        self._index = index
+
+    def __len__(self):
+        if isinstance(self._index, slice):
+            return self._index.stop - self._index.start
+        return self._index.size
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if isinstance(self._index, slice):
+                if not -len(self) <= key < len(self):
+                    raise IndexError("index %d is out of bounds for a view of size %d" % (key, len(self)))
+                i = self._index.start + key % len(self)
+            else:
+                i = self._index[key]
+            return self._text[self._offsets[i]:self._offsets[i + 1] - 1].decode('utf-8')
+        if isinstance(key, slice) and isinstance(self._index, slice) and key.step in (None, 1):
+            (start, stop, _) = key.indices(len(self))
+            return self._view(slice(self._index.start + start, self._index.start + max(start, stop)))
+        key = np.asarray(key) if not isinstance(key, slice) else key
+        return self._view(self._positions()[key].ravel())
+
+    def __iter__(self, block_size=10000):
+        if isinstance(self._index, slice):
+            # contiguous: decode whole blocks of sentences at once
+            for start in range(self._index.start, self._index.stop, block_size):
+                stop = min(start + block_size, self._index.stop)
+                yield from self._text[self._offsets[start]:self._offsets[stop] - 1].decode('utf-8').split('\n')
+        else:
+            for i in self._index:
+                yield self._text[self._offsets[i]:self._offsets[i + 1] - 1].decode('utf-8')
+
+    def __array__(self, dtype=None, copy=None):
+        # an object array of str, and not a fixed-width unicode array padded to the longest sentence
+        return np.array(list(self), dtype=dtype or object)
+
+    def __repr__(self):
+        return "CorpusView(%r, %d sentences)" % (self.directory, len(self))
+
+    def _positions(self):
+        if isinstance(self._index, slice):
+            return np.arange(self._index.start, self._index.stop)
+        return self._index
+
+    def _view(self, index):
+        return CorpusView(self.directory, self._text, self._offsets, index)
+
+    def __getstate__(self):
+        # the store is mapped again when unpickled (e.g. in worker processes)
+        return dict(directory=self.directory, index=self._index)
+
+    def __setstate__(self, state):
+        (view, _) = load_corpus(state['directory'])
+        self.__init__(view.directory, view._text, view._offsets, state['index'])
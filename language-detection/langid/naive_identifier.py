@@ -1,15 +1,120 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, TfidfTransformer
+from scipy.sparse import csr_matrix
+from collections import Counter
 import numpy as np
 from sklearn.preprocessing import normalize
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 
+from .parallel import effective_n_jobs
+
+
+def _fit_vectorizer(klass, options, samples):
+    v = klass(**options)
+    v.fit(samples)
+    return v
+
+
+class _NgramStats:
+    """
+    The ngram statistics of the samples of one class, kept by partial_fit: the ngrams in order of first
+    occurrence (terms, ids) and their term and document frequencies, in arrays indexed alike. Updates
+    only touch the ngrams of the new samples: new ngrams are appended, nothing is re-sorted.
+    """
+
+    def __init__(self):
+        self.terms = []
+        self.ids = dict()  # ngram => index in terms, tf and df
+        self.tf = np.zeros(1024, dtype=np.int64)
+        self.df = np.zeros(1024, dtype=np.int64)
+        self.n_docs = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.terms)
+
+    def update(self, docs):
+        """ Add the samples :param docs:, given as lists of ngrams. """
+        (tf, df) = (Counter(), Counter())
+        for grams in docs:
+            ids = [self._id(g) for g in grams]
+            tf.update(ids)
+            df.update(set(ids))
+            self.n_docs += 1
+        if self.size > self.tf.size:
+            extra = max(self.size, 2 * self.tf.size) - self.tf.size
+            self.tf = np.concatenate([self.tf, np.zeros(extra, dtype=np.int64)])
+            self.df = np.concatenate([self.df, np.zeros(extra, dtype=np.int64)])
+        for (freqs, counts) in ((self.tf, tf), (self.df, df)):
+            freqs[np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))] += \
+                np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+
+    def top(self, k=None) -> np.ndarray:
+        """
+        :return: the indices of the :param k: most frequent ngrams (all of them if k is None), sorted by ngram.
+            Ties on the smallest frequency kept are broken in the ngram order.
+        """
+        tf = self.tf[:self.size]
+        if k is None or k >= tf.size:
+            keep = np.arange(tf.size)
+        else:
+            threshold = np.partition(tf, tf.size - k)[tf.size - k]
+            above = np.flatnonzero(tf > threshold)
+            ties = sorted(np.flatnonzero(tf == threshold), key=self.terms.__getitem__)
+            keep = np.concatenate([above, np.array(ties[:k - above.size], dtype=np.int64)])
+        return np.array(sorted(keep, key=self.terms.__getitem__), dtype=np.int64)
+
+    def prune(self, max_terms: int):
+        """ Only keep the statistics of the :param max_terms: most frequent ngrams. """
+        keep = np.sort(self.top(max_terms))
+        self.__setstate__(dict(terms=[self.terms[i] for i in keep], tf=self.tf[keep], df=self.df[keep]))
+
+    @classmethod
+    def from_counters(cls, tf: Counter, df: Counter, n_docs: int) -> '_NgramStats':
+        """ :return: the statistics kept as Counters by the first versions of partial_fit. """
+        stats = cls.__new__(cls)
+        terms = list(tf)
+        stats.__setstate__(dict(terms=terms, tf=np.array([tf[t] for t in terms], dtype=np.int64),
+                                df=np.array([df[t] for t in terms], dtype=np.int64), n_docs=n_docs))
+        return stats
+
+    def __getstate__(self):
+        # don't pickle the unused capacity of the arrays, nor the ids (rebuilt from the terms)
+        return dict(terms=self.terms, tf=self.tf[:self.size], df=self.df[:self.size], n_docs=self.n_docs)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ids = dict((t, i) for (i, t) in enumerate(self.terms))
+
+    def _id(self, gram):
+        i = self.ids.get(gram)
+        if i is None:
+            i = self.ids[gram] = len(self.terms)
+            self.terms.append(gram)
+        return i
+
 
 class NaiveIdentifier:
     
-    def __init__(self, klass=TfidfVectorizer, **vectorizer_options):
+    def __init__(self, klass=TfidfVectorizer, class_jobs=1, cascade_margin=None, stats_max_terms=None,
+                 **vectorizer_options):
         """
         Create a naive identifier. 
         :param klass: the vectorizer class to use. Default to the sklean TfidfVectorizer.
+        :param class_jobs: the number of processes used to fit the vectorizers of the different classes
+            in parallel (-1 means all the cores). Not to be confused with the n_jobs option of some vectorizers
+            (e.g. NaiveVectorizer), which is passed through vectorizer_options and parallelizes the work of
+            each vectorizer: both combine, up to class_jobs * n_jobs processes.
+        :param cascade_margin: if set, predictions are computed in cascade (see _cascade_scores): the
+            smallest ngrams are scored first and longer ngrams only for the samples where the margin
+            between the two most probable languages (as returned by predict_proba) is below this threshold.
+            With the default options, 0.02 lets ~90% of the validation sentences exit after the trigrams
+            without changing the accuracy.
+        :param stats_max_terms: if set, partial_fit keeps the statistics of at most 2 * stats_max_terms ngrams
+            per class, dropping the least frequent ones down to stats_max_terms when the limit is reached:
+            memory is bounded, but the features selected later are approximate (a dropped ngram restarts
+            from 0). Should be well above max_features. None keeps every ngram (exact).
         :param vectorizer_options: the named arguments to pass to the vectorizer constructor.
             If klass is TfidfVectorizer, default options are: 
                 analyzer='char',  
@@ -20,6 +125,9 @@ class NaiveIdentifier:
                 norm='l2'
         """ 
         self.klass = klass
+        self.class_jobs = class_jobs
+        self.cascade_margin = cascade_margin
+        self.stats_max_terms = stats_max_terms
         if klass == TfidfVectorizer:
             # default vectorizer arguments
             self.options = dict(analyzer='char',  ngram_range=(3, 5), max_features=3000,
@@ -36,18 +144,101 @@ class NaiveIdentifier:
         :param X_train: the training set
         :param y_train: the class of each sample in the training set
         """
-        self.vectorizers = [] 
-        X_train = np.array(X_train)
-        y_train = np.array(y_train)
-        
-        # create and fit
-        for i in range(np.unique(y_train).size): 
-            v = self.klass(**self.options)
-            v.fit(X_train[y_train == i])  # train using samples of lang i
-            self.vectorizers.append(v)
+        self._index = None
+        self._stats = None
+
+        # group the samples by label in one pass
+        groups = dict()
+        for (x, y) in zip(X_train, y_train):
+            groups.setdefault(y, []).append(x)
+        self.classes_ = np.array(sorted(groups))
+        samples = [groups[y] for y in self.classes_]
+
+        # create and fit, one process per class
+        # models pickled before class_jobs was introduced named it n_jobs
+        class_jobs = getattr(self, 'class_jobs', getattr(self, 'n_jobs', 1))
+        class_jobs = min(len(samples), effective_n_jobs(class_jobs))
+        if class_jobs > 1:
+            with ProcessPoolExecutor(class_jobs) as executor:
+                self.vectorizers = list(executor.map(_fit_vectorizer, repeat(self.klass), repeat(self.options), samples))
+        else:
+            self.vectorizers = [_fit_vectorizer(self.klass, self.options, s) for s in samples]
             
         return self # for pipelining 
     
+    def partial_fit(self, X, y):
+        """
+        Update the model with new samples. The ngram statistics (term and document frequencies) of each
+        class are updated incrementally, then only the vectorizers of the classes present in :param y: are
+        rebuilt from them (re-ranking the features). Labels never seen before are added to classes_.
+        The update only touches the ngrams of the batch; rebuilding a vectorizer selects its features
+        among the ngrams of its class in linear time, without re-sorting them.
+
+        The statistics are only kept by partial_fit: to update a model later, train it using partial_fit
+        instead of fit (the resulting vectorizers are the same, min_df/max_df options are not supported,
+        and the ngrams tied at the max_features cut are chosen in the ngram order, where fit picks any).
+        They hold every ngram seen, unless stats_max_terms is set (see __init__).
+
+        :param X: the new samples
+        :param y: the class of each new sample
+        """
+        if getattr(self, '_stats', None) is None:
+            if getattr(self, 'vectorizers', None):
+                raise ValueError('partial_fit: this model was trained using fit, which does not keep statistics')
+            (self._stats, self.vectorizers, self.classes_) = (dict(), [], np.array([]))
+
+        analyzer = self.klass(**self.options).build_analyzer()
+        batches = dict()
+        for (x, label) in zip(X, y):
+            batches.setdefault(label, []).append(analyzer(x))
+
+        max_terms = getattr(self, 'stats_max_terms', None)
+        classes = list(self.classes_)
+        for label in sorted(batches):
+            stats = self._stats.get(label)
+            if isinstance(stats, dict):  # statistics of the first versions of partial_fit
+                stats = _NgramStats.from_counters(**stats)
+            stats = self._stats[label] = stats or _NgramStats()
+            stats.update(batches[label])
+            if max_terms is not None and stats.size > 2 * max_terms:
+                stats.prune(max_terms)
+
+            v = self._vectorizer_from_stats(stats)
+            if label in classes:
+                self.vectorizers[classes.index(label)] = v
+            else:
+                classes.append(label)
+                self.vectorizers.append(v)
+        self.classes_ = np.array(classes)
+        self._index = None
+        return self
+
+
+    def _vectorizer_from_stats(self, stats):
+        """
+        Create a vectorizer as if it was fitted on the samples summarized by :param stats: (a _NgramStats).
+        """
+        v = self.klass(**self.options)
+        if hasattr(v, 'fit_counts'):
+            v.fit_counts(stats.terms, stats.tf[:stats.size])
+            return v
+
+        # keep the max_features most frequent terms, with the sklearn vocabulary ordering
+        keep = stats.top(getattr(v, 'max_features', None))
+        v.vocabulary_ = dict((stats.terms[i], j) for (j, i) in enumerate(keep))
+        v.fixed_vocabulary_ = False
+
+        if isinstance(v, TfidfVectorizer):
+            v._tfidf = TfidfTransformer(norm=v.norm, use_idf=v.use_idf, smooth_idf=v.smooth_idf,
+                                        sublinear_tf=v.sublinear_tf).fit(csr_matrix((1, keep.size)))
+            if v.use_idf:
+                (df, n) = (stats.df[keep].astype(np.float64), stats.n_docs)
+                if v.smooth_idf:
+                    (df, n) = (df + 1, n + 1)
+                v.idf_ = np.log(n / df) + 1
+        return v
+
+
     def fit_predict(self, X_train, y_train):
         """
         Call fit, then predict
@@ -62,9 +253,9 @@ class NaiveIdentifier:
         :param X: the dataset
         :return: the most probable class as a numpy matrix
         """
-        mat = np.hstack([v.transform(X).sum(axis=1) for v in self.vectorizers])
+        mat = self._scores(X)
         self.last_scores = mat # for later use, just in case
-        return mat.argmax(axis=1).A1
+        return self._labels(mat.argmax(axis=1))
 
 
     def predict_proba(self, X: List[int]):
@@ -74,6 +265,221 @@ class NaiveIdentifier:
         :param X: the dataset
         :return: the most probable class as a numpy.ndarray
         """
-        mat = np.hstack([v.transform(X).sum(axis=1) for v in self.vectorizers])
+        mat = self._scores(X)
         self.last_scores = mat # for later use, just in case
-        return normalize(mat, norm='l1', axis=1)
\ No newline at end of file
+        return normalize(mat, norm='l1', axis=1)
+
+
+    def _labels(self, idx):
+        """
+        Convert indices of vectorizers into labels (models fitted before classes_ existed use indices).
+        """
+        classes = getattr(self, 'classes_', None)
+        return idx if classes is None else classes[idx]
+
+
+    def _scores(self, X):
+        """
+        Compute the sum of the feature vectors of each sample for each language.
+        :return: a numpy.ndarray of shape (len(X), number of languages)
+        """
+        index = self._get_index()
+        if index is None:
+            # unknown vectorizer: transform the data once per language
+            return np.asarray(np.hstack([v.transform(X).sum(axis=1) for v in self.vectorizers]))
+        if getattr(self, 'cascade_margin', None) is not None and self._stage_analyzers() is not None:
+            return self._cascade_scores(X)
+        return self._normalize(*self._accumulate(X, index['analyzer'], index), index['norm'])
+
+
+    def _accumulate(self, X, analyzer, index, block_size=100000):
+        """
+        Tokenize X using :param analyzer: and accumulate the weighted ngrams found in the index.
+
+        No document-term matrix is built: the ngrams of each sample are counted on their own, and the
+        (ngram, count) pairs are reduced to per-language sums every :param block_size: pairs. Peak memory
+        thus depends on the block size and on the longest sample, not on the size of the batch.
+
+        :return: a tuple (sums, acc) of arrays of shape (len(X), number of languages), with acc the 
+            accumulator of the norm (sum of squares for l2, sum of absolute values for l1).
+        """
+        vocabulary = index['vocabulary']
+        blocks = []
+        (ids, counts, lengths) = ([], [], [])
+        for x in X:
+            found = [(vocabulary[g], c) for (g, c) in Counter(analyzer(x)).items() if g in vocabulary]
+            ids += [t[0] for t in found]
+            counts += [t[1] for t in found]
+            lengths.append(len(found))
+            if len(ids) >= block_size:
+                blocks.append(self._accumulate_block(ids, counts, lengths, index))
+                (ids, counts, lengths) = ([], [], [])
+        if len(lengths) > 0 or len(blocks) == 0:
+            blocks.append(self._accumulate_block(ids, counts, lengths, index))
+        return np.vstack([b[0] for b in blocks]), np.vstack([b[1] for b in blocks])
+
+
+    def _accumulate_block(self, ids, counts, lengths, index):
+        """
+        Reduce the (ngram id, count) pairs of len(lengths) samples to per-language sums, see _accumulate.
+        """
+        weights = index['weights']
+        n_docs = len(lengths)
+        rows = np.repeat(np.arange(n_docs, dtype=np.int64), np.array(lengths, dtype=np.int64))
+        cols = np.array(ids, dtype=np.int64)
+        tf = self._tf(np.array(counts, dtype=np.int64), index)
+
+        sums = np.zeros((n_docs, weights.shape[1]))
+        acc = np.zeros((n_docs, weights.shape[1]))
+        for j in range(weights.shape[1]):
+            x = tf * weights[cols, j]
+            sums[:, j] = np.bincount(rows, weights=x, minlength=n_docs)
+            if index['norm'] == 'l2':
+                acc[:, j] = np.bincount(rows, weights=x ** 2, minlength=n_docs)
+            elif index['norm'] == 'l1':
+                acc[:, j] = np.bincount(rows, weights=np.abs(x), minlength=n_docs)
+        return sums, acc
+
+
+    @staticmethod
+    def _normalize(sums, acc, norm):
+        """
+        Apply the normalisation of the vectorizers to the accumulated sums (see _accumulate).
+        """
+        if norm not in ('l1', 'l2'):
+            return sums
+        norms = np.sqrt(acc) if norm == 'l2' else acc
+        return np.divide(sums, norms, out=np.zeros_like(sums), where=norms > 0)
+
+
+    def _cascade_scores(self, X):
+        """
+        Compute the scores order by order, starting with the smallest ngrams: after each order,
+        the samples for which the margin between the two most probable languages is at least
+        cascade_margin keep their current scores, the others are completed with the next order.
+        Samples going through all the orders get the same scores as without the cascade.
+        Statistics are stored in cascade_stats_.
+        """
+        index = self._get_index()
+        stages = self._stage_analyzers()
+        X = list(X)
+        sums = np.zeros((len(X), index['weights'].shape[1]))
+        acc = np.zeros_like(sums)
+        active = np.arange(len(X))
+        exits = []
+
+        for (i, analyzer) in enumerate(stages):
+            if active.size == 0:
+                break
+            (s, a) = self._accumulate([X[k] for k in active], analyzer, index)
+            sums[active] += s
+            acc[active] += a
+            if i == len(stages) - 1:
+                exits.append(active.size)
+                break
+            proba = normalize(self._normalize(sums[active], acc[active], index['norm']), norm='l1', axis=1)
+            top2 = -np.sort(-proba, axis=1)[:, :2] if proba.shape[1] > 1 else np.zeros((proba.shape[0], 2))
+            done = top2[:, 0] - top2[:, 1] >= self.cascade_margin
+            exits.append(int(done.sum()))
+            active = active[~done]
+
+        self.cascade_stats_ = dict(
+            n_samples=len(X),
+            exits=exits,  # number of samples leaving the cascade after each ngram order
+            early_exit=(len(X) - (exits[-1] if len(exits) == len(stages) else 0)) / max(len(X), 1))
+        return self._normalize(sums, acc, index['norm'])
+
+
+    def _stage_analyzers(self):
+        """
+        Create one analyzer per ngram order for the cascade. Return None if the vectorizers don't
+        use a (built-in) analyzer with an ngram range whose orders yield distinct ngrams: char_wb
+        yields the short (padded) words at several orders, so its stages would count them several times.
+        """
+        index = self._get_index()
+        if 'stages' not in index:
+            v = self.vectorizers[0]
+            nrange = getattr(v, 'ngram_range', getattr(v, 'nrange', None))
+            analyzer = getattr(v, 'analyzer', None)
+            if nrange is None or (analyzer is not None and analyzer not in ('char', 'word')):
+                index['stages'] = None
+            else:
+                index['stages'] = [self.klass(**dict(self.options, ngram_range=(n, n))).build_analyzer()
+                                   for n in range(nrange[0], nrange[1] + 1)]
+        return index['stages']
+
+
+    def cascade_report(self, X, y=None) -> dict:
+        """
+        Compare the cascade (see cascade_margin) with the full scoring on :param X:.
+        :param y: the real labels, to also compare the accuracies.
+        :return: a dictionary with the fraction of samples exiting early, the fraction of
+            identical predictions and, if y is given, the accuracy of both scorings.
+        """
+        margin = getattr(self, 'cascade_margin', None)
+        try:
+            self.cascade_margin = None
+            full = self.predict(X)
+        finally:
+            self.cascade_margin = margin
+        cascade = self.predict(X)
+
+        report = dict(early_exit=self.cascade_stats_['early_exit'], agreement=np.mean(full == cascade))
+        if y is not None:
+            report['accuracy_full'] = np.mean(full == np.asarray(y))
+            report['accuracy_cascade'] = np.mean(cascade == np.asarray(y))
+            report['accuracy_diff'] = report['accuracy_cascade'] - report['accuracy_full']
+        return report
+
+
+    @staticmethod
+    def _tf(counts, index):
+        """
+        Apply the term frequency weighting of the vectorizers to the raw :param counts:.
+        """
+        tf = counts.astype(np.float64)
+        if index['binary']:
+            tf.fill(1)
+        if index['sublinear_tf']:
+            tf = 1 + np.log(tf)
+        return tf
+
+
+    def _get_index(self):
+        """
+        Merge the vocabularies of all the vectorizers into one index, so that a single tokenization pass
+        computes the scores of every language. The index holds:
+            - analyzer: the function extracting the ngrams of a sample (shared by all vectorizers);
+            - vocabulary: a dictionary 'N-gram' => row in weights;
+            - weights: the (idf) weight of each ngram in each language, 0 if not part of its vocabulary;
+            - binary, sublinear_tf, norm: the weighting options of the vectorizers.
+        The index is built on first use. It is None if the vectorizers don't expose their vocabulary
+        (vocabulary_) and analyzer (build_analyzer), in which case they are used as black boxes.
+        """
+        if getattr(self, '_index', None) is None:
+            if not all(hasattr(v, 'vocabulary_') and hasattr(v, 'build_analyzer') for v in self.vectorizers):
+                return None
+            vocabulary = dict()
+            (rows, cols, values) = ([], [], [])
+            for (j, v) in enumerate(self.vectorizers):
+                idf = v.idf_ if getattr(v, 'use_idf', False) else None
+                for (ng, i) in v.vocabulary_.items():
+                    rows.append(vocabulary.setdefault(ng, len(vocabulary)))
+                    cols.append(j)
+                    values.append(1.0 if idf is None else idf[i])
+            weights = np.zeros((len(vocabulary), len(self.vectorizers)))
+            weights[rows, cols] = values
+
+            v = self.vectorizers[0]
+            self._index = dict(
+                analyzer=v.build_analyzer(), vocabulary=vocabulary, weights=weights,
+                binary=getattr(v, 'binary', False), sublinear_tf=getattr(v, 'sublinear_tf', False),
+                norm=getattr(v, 'norm', None))
+        return self._index
+
+
+    def __getstate__(self):
+        # the index is rebuilt on demand, don't pickle it
+        state = self.__dict__.copy()
+        state.pop('_index', None)
+        return state
\ No newline at end of file
@@ -0,0 +1,136 @@
+from collections import defaultdict, Counter, OrderedDict
+from itertools import chain
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+from .sanitization_cache import content_hash
+
+
+class NgramCountCache:
+    """
+    Cache of the ngram counts of datasets: for each dataset and ngram order, the document-term
+    count matrix of all the ngrams of this order.
+
+    Vectorizers holding the cache (see the ngram_cache option of WrappedVectorizer and
+    NaiveVectorizer) derive their vocabulary and document-term matrix from these counts, so that
+    the candidates of a grid search over ngram_range and max_features tokenize each fold only
+    once per ngram order.
+
+    Like SanitizationCache, the same instance is kept when the object holding it is deep copied
+    (sklearn's clone does), and the counts are not pickled.
+    """
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024):
+        """
+        :param max_bytes: the maximal size of the count matrices kept in memory, the least recently
+            used being evicted first.
+        """
+        self.max_bytes = max_bytes
+        self._init_memory()
+
+    def _init_memory(self):
+        self._entries = OrderedDict()  # (key, digest, order) => ((terms, counts), size)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def counts(self, key: str, data, ngram_range, analyzer):
+        """
+        Get the counts of the ngrams of :param data: with an order in :param ngram_range:.
+
+        :param key: identifies the analysis: the same key must always produce the same ngrams.
+        :param data: the texts.
+        :param ngram_range: the bounds (inclusive) of the ngram orders.
+        :param analyzer: a function n => callable returning the ngrams of order n of a text,
+            called on a miss only. Different orders must yield different ngrams (this excludes
+            sklearn's char_wb analyzer, which yields short padded words at several orders).
+        :return: a tuple (terms, counts): the distinct ngrams, sorted, and the csr count matrix of
+            shape (len(data), len(terms)).
+        """
+        data = data if isinstance(data, list) else list(data)
+        digest = content_hash(data)
+        parts = [self._order_counts((key, digest, n), data, analyzer, n)
+                 for n in range(ngram_range[0], ngram_range[1] + 1)]
+        return self._combine(parts, len(data))
+
+    def report(self) -> dict:
+        """
+        :return: the hits, misses (one per dataset and ngram order) and memory usage of the cache.
+        """
+        return dict(hits=self.hits, misses=self.misses, entries=len(self._entries),
+                    nbytes=self.nbytes, max_bytes=self.max_bytes)
+
+    def clear(self):
+        """ Empty the cache and reset the statistics. """
+        self._init_memory()
+
+    # -- private methods
+
+    def _order_counts(self, entry_key, data, analyzer, n):
+        if entry_key in self._entries:
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return self._entries[entry_key][0]
+
+        self.misses += 1
+        value = self._count(data, analyzer(n))
+        (terms, X) = value
+        size = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes + sum(map(len, terms)) + 64 * terms.size
+        if size <= self.max_bytes:
+            self._entries[entry_key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                (_, (_, evicted_size)) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+        return value
+
+    @staticmethod
+    def _count(data, analyze):
+        # same as the sklearn CountVectorizer, without failing on an empty vocabulary
+        vocabulary = defaultdict()
+        vocabulary.default_factory = vocabulary.__len__
+        rows = [Counter(map(vocabulary.__getitem__, analyze(doc))) for doc in data]
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=indptr[-1])
+        values = np.fromiter(chain.from_iterable(r.values() for r in rows), dtype=np.int64, count=indptr[-1])
+
+        # sort the terms, as sklearn does
+        terms = np.empty(len(vocabulary), dtype=object)
+        terms[list(vocabulary.values())] = list(vocabulary.keys())
+        order = terms.argsort()
+        remap = np.empty_like(order)
+        remap[order] = np.arange(order.size)
+        X = csr_matrix((values, remap[indices], indptr), shape=(len(rows), terms.size), dtype=np.int64)
+        X.sort_indices()
+        return terms[order], X
+
+    @staticmethod
+    def _combine(parts, n_rows):
+        if len(parts) == 1:
+            return parts[0]
+        # the orders must yield distinct terms (true for the char and word analyzers, whose ngrams of
+        # different orders differ in length or number of words), so the matrices are simply stacked
+        terms = np.concatenate([p[0] for p in parts])
+        order = terms.argsort()
+        if terms.size > 1 and (terms[order][1:] == terms[order][:-1]).any():
+            raise ValueError("the ngram orders yield the same terms: their counts cannot be combined")
+        remap = np.empty_like(order)
+        remap[order] = np.arange(order.size)
+        X = hstack([p[1] for p in parts], format='csr')
+        X = csr_matrix((X.data, remap[X.indices], X.indptr), shape=(n_rows, terms.size))
+        X.sort_indices()
+        return terms[order], X
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        return dict(max_bytes=self.max_bytes)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_memory()
+
+    def __repr__(self):
+        return "NgramCountCache(max_bytes=%r)" % self.max_bytes
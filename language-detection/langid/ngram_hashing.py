@@ -0,0 +1,152 @@
+import re
+import numpy as np
+
+# multiplier of the polynomial rolling hash (odd, so that it is invertible modulo 2^64)
+_P = np.uint64(0x100000001B3)
+
+# match characters that cannot make an ngram a "word" ngram (see NaiveVectorizer.ignore_non_words)
+_reg_nonword = re.compile(r"[\W|\d]")
+
+
+def encode(texts, lower=True):
+    """
+    Concatenate :param texts: into one array of unicode codepoints.
+
+    :param texts: an iterable of strings.
+    :param lower: if set, the strings are transformed to lowercase first.
+    :return: a tuple (codes, offsets), where the text i spans codes[offsets[i]:offsets[i+1]].
+    """
+    texts = [t.lower() for t in texts] if lower else list(texts)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)), out=offsets[1:])
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+    return codes, offsets
+
+
+def word_chars(codes):
+    """
+    :return: a boolean array telling if each codepoint is a letter (i.e. not matching [\\W|\\d]).
+    """
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    table = np.array([_reg_nonword.match(chr(c)) is None for c in uniq], dtype=bool)
+    return table[inverse].reshape(codes.shape)
+
+
+def ngram_hashes(codes, offsets, ngram_range, words_only=False):
+    """
+    Compute the hash of every ngram of :param codes: without creating any substring,
+    using a polynomial rolling hash: the hashes of ngrams of size n are derived from the hashes
+    of size n-1 with one vectorized operation. Ngrams spanning two texts are discarded.
+
+    :param codes: the codepoints, as returned by encode.
+    :param offsets: the boundaries of each text, as returned by encode.
+    :param ngram_range: the bounds (inclusive) of the ngram sizes.
+    :param words_only: if set, discard ngrams with no letter (see word_chars).
+    :return: a tuple (hashes, rows, starts, sizes) with, for each ngram, its hash, the index of
+        the text it belongs to, its start in codes and its size.
+    """
+    n_min, n_max = ngram_range
+    lengths = np.diff(offsets)
+    ends = np.repeat(offsets[1:], lengths)
+    rows_all = np.repeat(np.arange(lengths.size, dtype=np.int64), lengths)
+    positions = np.arange(codes.size, dtype=np.int64)
+    if words_only:
+        cumwords = np.concatenate(([0], np.cumsum(word_chars(codes), dtype=np.int64)))
+
+    values = codes.astype(np.uint64) + np.uint64(1)  # avoid 0, which would make "\0ab" == "ab"
+    h = np.zeros(codes.size, dtype=np.uint64)
+    hashes, rows, starts, sizes = [], [], [], []
+    for n in range(1, n_max + 1):
+        m = codes.size - n + 1
+        if m <= 0:
+            break
+        h = h[:m] * _P + values[n - 1:]
+        if n < n_min:
+            continue
+        valid = positions[:m] + n <= ends[:m]
+        if words_only:
+            valid &= cumwords[n:] - cumwords[:m] > 0
+        idx = np.flatnonzero(valid)
+        # mix the size into the hash, so that ngrams of different sizes never share the same sequence
+        hashes.append(h[idx] * _P + np.uint64(n))
+        rows.append(rows_all[idx])
+        starts.append(idx)
+        sizes.append(np.full(idx.size, n, dtype=np.int64))
+
+    if len(hashes) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(0, dtype=np.uint64), empty, empty, empty
+    return np.concatenate(hashes), np.concatenate(rows), np.concatenate(starts), np.concatenate(sizes)
+
+
+def count_ngrams(texts, ngram_range, words_only=False, batch_size=10000):
+    """
+    Count all the ngrams in :param texts:. Only the distinct ngrams are converted to strings.
+
+    :return: a tuple (ngrams, counts), ngrams being sorted alphabetically (as with np.unique).
+    """
+    all_hashes = np.zeros(0, dtype=np.uint64)
+    all_counts = np.zeros(0, dtype=np.int64)
+    all_ngrams = np.zeros(0, dtype=object)
+
+    texts = list(texts)
+    for i in range(0, len(texts), batch_size):
+        batch = [t.lower() for t in texts[i:i + batch_size]]
+        codes, offsets = encode(batch, lower=False)
+        hashes, _, starts, sizes = ngram_hashes(codes, offsets, ngram_range, words_only)
+        (uniq, first, cnts) = np.unique(hashes, return_index=True, return_counts=True)
+
+        # only create the strings of ngrams never seen before
+        new = ~np.isin(uniq, all_hashes, assume_unique=True)
+        buffer = ''.join(batch)
+        ngrams = np.empty(uniq.size, dtype=object)
+        ngrams[new] = [buffer[s:s + n] for (s, n) in zip(starts[first[new]], sizes[first[new]])]
+
+        merged, inverse = np.unique(np.concatenate((all_hashes, uniq)), return_inverse=True)
+        all_counts = np.bincount(inverse, weights=np.concatenate((all_counts, cnts)),
+                                 minlength=merged.size).astype(np.int64)
+        merged_ngrams = np.empty(merged.size, dtype=object)
+        merged_ngrams[inverse[:all_hashes.size]] = all_ngrams
+        merged_ngrams[inverse[all_hashes.size:][new]] = ngrams[new]
+        all_hashes, all_ngrams = merged, merged_ngrams
+
+    if all_ngrams.size == 0:
+        return np.zeros(0, dtype=str), all_counts
+    names = np.array(all_ngrams.tolist(), dtype=str)
+    idx_sorted = names.argsort(kind='stable')
+    return names[idx_sorted], all_counts[idx_sorted]
+
+
+class HashedVocabulary:
+    """
+    A lookup table mapping the hash of each ngram of a vocabulary to its feature index.
+    """
+
+    def __init__(self, names):
+        """
+        :param names: the ngrams of the vocabulary, the index of each ngram being its feature index.
+        """
+        codes, offsets = encode(names, lower=False)
+        lengths = np.diff(offsets)
+        hashes = np.zeros(len(names), dtype=np.uint64)
+        for n in np.unique(lengths):
+            (h, rows, starts, _) = ngram_hashes(codes, offsets, (n, n))
+            full = (starts == offsets[rows]) & (lengths[rows] == n)  # ngram spanning the whole name
+            hashes[rows[full]] = h[full]
+        self._order = hashes.argsort()
+        self._hashes = hashes[self._order]
+
+    def lookup(self, texts, ngram_range):
+        """
+        Find all the ngrams of :param texts: part of the vocabulary.
+
+        :return: a tuple (rows, cols) with, for each ngram found, the index of the text it
+            belongs to and its feature index.
+        """
+        codes, offsets = encode(texts)
+        (hashes, rows, _, _) = ngram_hashes(codes, offsets, ngram_range)
+        if self._hashes.size == 0:
+            return rows[:0], rows[:0]
+        pos = np.searchsorted(self._hashes, hashes).clip(max=self._hashes.size - 1)
+        found = self._hashes[pos] == hashes
+        return rows[found], self._order[pos[found]]
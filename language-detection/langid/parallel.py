@@ -0,0 +1,51 @@
+import os
+from multiprocessing import Pool
+
+# the object shared by all the chunks processed by a worker, see map_chunks
+_shared = None
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _call(args):
+    (method, chunk) = args
+    return getattr(_shared, method)(chunk)
+
+
+def effective_n_jobs(n_jobs) -> int:
+    """
+    :return: the number of processes to use: n_jobs < 0 means "all the cores but n_jobs + 1".
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def chunks(data, chunk_size: int) -> list:
+    """
+    Split :param data: (any sequence or iterable) into lists of at most :param chunk_size: items.
+    """
+    data = data if hasattr(data, '__getitem__') else list(data)
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def map_chunks(obj, method: str, data, n_jobs: int, chunk_size: int) -> list:
+    """
+    Split :param data: into chunks and call obj.<method>(chunk) on each of them using a pool of
+    :param n_jobs: processes. :param obj: is handed to each worker once, when the worker starts
+    (it is inherited when processes are forked), so a fitted vocabulary is not pickled again for
+    every chunk.
+
+    :return: the results of each call, in the order of the chunks.
+    """
+    parts = chunks(data, chunk_size)
+    n_jobs = min(effective_n_jobs(n_jobs), len(parts))
+    if n_jobs <= 1:
+        return [getattr(obj, method)(chunk) for chunk in parts]
+    with Pool(n_jobs, initializer=_init_worker, initargs=(obj,)) as pool:
+        return pool.map(_call, [(method, chunk) for chunk in parts], chunksize=1)
@@ -18,4 +18,76 @@ def sanitize(text: str) -> str:
     return text.strip()
 
 
-np_sanitize = np.vectorize(sanitize)
+# ==========================
+#  batch sanitization
+# ==========================
+
+# _replacements[c] is the codepoint replacing c: a space if c matches reg_nonletters, else c itself.
+# It is extended lazily, up to the largest codepoint seen so far
+_replacements = np.zeros(0, dtype=np.uint32)
+
+
+def _replacements_table(max_code: int):
+    """
+    :return: the table of replacements (see _replacements), covering at least :param max_code:.
+    """
+    global _replacements
+    if max_code >= _replacements.size:
+        # extend by whole blocks of 4096 codepoints, to call the regex rarely
+        (start, stop) = (_replacements.size, (max_code // 4096 + 1) * 4096)
+        chars = ''.join(map(chr, range(start, stop)))
+        table = np.arange(start, stop, dtype=np.uint32)
+        table[[m.start() for m in reg_nonletters.finditer(chars)]] = 32
+        _replacements = np.concatenate((_replacements, table))
+    return _replacements
+
+
+def _sanitize_batch(texts) -> list:
+    if len(texts) == 0:
+        return []
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    # separate the texts with a NUL, restored after the nonletters are replaced (a NUL in a text
+    # is a nonletter, hence replaced by a space like any other)
+    codes = np.frombuffer('\0'.join(texts).encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+    if codes.size == 0:
+        return ['']
+    codes = _replacements_table(int(codes.max()))[codes]
+    codes[np.cumsum(lengths[:-1] + 1) - 1] = 0
+
+    # remove_manyspaces: keep only the first space of each run (all the whitespaces are nonletters,
+    # so only spaces are left)
+    spaces = codes == 32
+    keep = ~spaces
+    keep[0] = True
+    keep[1:] |= ~spaces[:-1]
+    codes = codes[keep]
+
+    # strip: drop the spaces at the start or at the end of a text
+    spaces = codes == 32
+    bounds = np.concatenate(([True], codes == 0, [True]))
+    codes = codes[~(spaces & (bounds[:-2] | bounds[2:]))]
+
+    return codes.tobytes().decode('utf-32-le', 'surrogatepass').split('\0')
+
+
+def sanitize_all(texts, batch_size=1000) -> list:
+    """
+    Sanitize all the :param texts: at once: the output is exactly [sanitize(t) for t in texts],
+    but the texts of a batch of :param batch_size: are processed as one array of codepoints,
+    without any regex call per text.
+    """
+    texts = list(texts)
+    result = []
+    for i in range(0, len(texts), batch_size):
+        result += _sanitize_batch(texts[i:i + batch_size])
+    return result
+
+
+def np_sanitize(texts):
+    """
+    Batch version of :func:sanitize, for a list or array of strings (or a single string).
+    :return: a numpy array of the sanitized strings.
+    """
+    if isinstance(texts, str):
+        return np.array(sanitize(texts))
+    return np.array(sanitize_all(texts), dtype=object)
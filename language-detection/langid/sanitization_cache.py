@@ -0,0 +1,206 @@
+import hashlib
+import os
+import pickle
+import re
+import sys
+import tempfile
+import types
+from collections import OrderedDict
+
+import numpy as np
+
+_regex_type = type(re.compile(''))
+
+
+def sanitizer_key(sanitizer) -> str:
+    """
+    :return: a key identifying :param sanitizer:: the module and qualified name of a function and a
+        digest of its code (see _code_digest), so that the entries of a modified sanitizer are not
+        reused; the repr of any other object. Lambdas and nested functions, whose names are not
+        unique, also get their id: their key is only valid in the current process (see is_persistent).
+    """
+    if sanitizer is None:
+        return 'None'
+    name = getattr(sanitizer, '__qualname__', None)
+    if name is None:
+        return repr(sanitizer)
+    key = "%s.%s" % (getattr(sanitizer, '__module__', ''), name)
+    if hasattr(sanitizer, '__code__'):
+        key += "#" + _code_digest(sanitizer)
+    if not is_persistent(sanitizer):
+        key += "@%x" % id(sanitizer)
+    return key
+
+
+def is_persistent(sanitizer) -> bool:
+    """
+    :return: True if the key of :param sanitizer: (see sanitizer_key) identifies it across processes,
+        i.e. if it is a function defined at the top level of a module, so that its entries can be
+        stored on disk.
+    """
+    if sanitizer is None:
+        return True
+    name = getattr(sanitizer, '__qualname__', None)
+    return name is not None and hasattr(sanitizer, '__code__') and '<lambda>' not in name and '<locals>' not in name
+
+
+def _code_digest(func) -> str:
+    """
+    :return: a digest of the bytecode, names and constants of :param func:, of the functions of its module
+        it references (recursively) and of the constants (e.g. regexes) of its module it references.
+    """
+    h = hashlib.blake2b(digest_size=10)
+    seen = set()
+
+    def add_function(f):
+        if id(f) in seen:
+            return
+        seen.add(id(f))
+        names = set()
+        add_code(f.__code__, names)
+        module_globals = getattr(f, '__globals__', dict())
+        for name in sorted(names):
+            value = module_globals.get(name)
+            if isinstance(value, types.FunctionType) and value.__module__ == f.__module__:
+                add_function(value)
+            elif isinstance(value, _regex_type):
+                h.update(("%s/%s" % (value.pattern, value.flags)).encode('utf-8', 'surrogatepass'))
+            elif isinstance(value, (str, bytes, int, float, tuple, frozenset)):
+                h.update(repr(value).encode('utf-8', 'surrogatepass'))
+
+    def add_code(code, names):
+        h.update(code.co_code)
+        h.update(repr(code.co_names).encode('utf-8'))
+        names.update(code.co_names)
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                add_code(const, names)
+            else:
+                h.update(repr(const).encode('utf-8', 'surrogatepass'))
+
+    add_function(func)
+    return h.hexdigest()
+
+
+def content_hash(data, labels=None) -> str:
+    """
+    :return: a digest of the texts :param data: (and of :param labels:, if set).
+    """
+    h = hashlib.blake2b(digest_size=20)
+    texts = data if isinstance(data, list) else list(data)
+    # the lengths prevent ['a b'] and ['a', 'b'] from sharing the same digest
+    h.update(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)).tobytes())
+    h.update(' '.join(texts).encode('utf-8', 'surrogatepass'))
+    if labels is not None:
+        h.update(repr(np.asarray(labels).tolist()).encode('utf-8'))
+    return h.hexdigest()
+
+
+class SanitizationCache:
+    """
+    LRU cache of sanitized datasets, so that the same data (e.g. the folds of a grid search) is
+    sanitized only once. The entries are kept in memory up to :param max_bytes:, and optionally
+    written to :param directory: so that several processes (e.g. the workers of a parallel grid
+    search) share them.
+
+    The same instance is kept when the object holding it is deep copied (sklearn's clone does), and
+    only the directory is kept when it is pickled.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, directory=None):
+        """
+        :param max_bytes: the maximal (estimated) size of the entries kept in memory.
+        :param directory: if set, the folder where the entries are stored (created if needed).
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._init_memory()
+
+    def _init_memory(self):
+        self._entries = OrderedDict()  # key => (value, size), least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, compute, persistent=True):
+        """
+        :return: the value cached under :param key:, calling :param compute: (without arguments)
+            to create it on a miss.
+        :param persistent: if unset, the entry is only kept in memory, even if the cache has a directory
+            (for keys which are only valid in the current process, see is_persistent).
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+        value = self._load(key) if persistent else None
+        if value is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            value = compute()
+            if persistent:
+                self._store(key, value)
+        self._remember(key, value)
+        return value
+
+    def report(self) -> dict:
+        """
+        :return: the hits (in memory or on disk), misses and memory usage of the cache.
+        """
+        return dict(hits=self.hits, disk_hits=self.disk_hits, misses=self.misses,
+                    entries=len(self._entries), nbytes=self.nbytes, max_bytes=self.max_bytes)
+
+    def clear(self):
+        """ Empty the memory (not the directory) and reset the statistics. """
+        self._init_memory()
+
+    # -- private methods
+
+    def _remember(self, key, value):
+        size = sys.getsizeof(value) + sum(map(sys.getsizeof, value))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            (_, (_, evicted_size)) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_size
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pickle')
+
+    def _load(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _store(self, key, value):
+        if self.directory is None:
+            return
+        # write to a temporary file first, so that other processes never read a partial entry
+        (fd, tmp) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        return dict(max_bytes=self.max_bytes, directory=self.directory)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_memory()
+
+    def __repr__(self):
+        return "SanitizationCache(max_bytes=%r, directory=%r)" % (self.max_bytes, self.directory)
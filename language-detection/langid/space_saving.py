@@ -0,0 +1,77 @@
+from collections import Counter
+import numpy as np
+
+
+class SpaceSaving:
+    """
+    Approximate top-k counter using a batched variant of the space-saving algorithm.
+
+    At most 2 * capacity items are tracked. When this limit is reached, the capacity least
+    frequent items are evicted and the largest evicted count becomes the "floor": an item entering
+    the structure later starts counting from the floor, which is also its maximal overestimation.
+    Hence, for each tracked item: count - error <= true count <= count.
+
+    Memory only depends on the capacity, not on the length of the stream.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: the number of items to keep after each eviction. It should be a few
+            times larger than the k of the top-k to get accurate results.
+        """
+        self.capacity = capacity
+        self.counts = dict()  # item => estimated count
+        self.errors = dict()  # item => maximal overestimation of the count
+        self.floor = 0  # largest count evicted so far
+        self.total = 0  # number of items seen
+
+    def update(self, items):
+        """
+        Count the occurrences of :param items:, evicting the least frequent items if needed.
+        """
+        counts, errors, floor = self.counts, self.errors, self.floor
+        for item, c in Counter(items).items():
+            self.total += c
+            if item in counts:
+                counts[item] += c
+            else:
+                counts[item] = floor + c
+                errors[item] = floor
+        if len(counts) > 2 * self.capacity:
+            self._evict()
+
+    def _evict(self):
+        items = list(self.counts.keys())
+        cnts = np.fromiter(self.counts.values(), dtype=np.int64, count=len(items))
+        idx_evicted = np.argpartition(-cnts, self.capacity)[self.capacity:]
+        self.floor = max(self.floor, int(cnts[idx_evicted].max()))
+        for i in idx_evicted:
+            del self.counts[items[i]]
+            del self.errors[items[i]]
+
+    def most_common(self, k: int):
+        """
+        Return the :param k: items with the highest estimated count as a list of
+        (item, count, error), ordered by decreasing count then by item.
+        """
+        top = sorted(self.counts.items(), key=lambda t: (-t[1], t[0]))[:k]
+        return [(item, cnt, self.errors[item]) for (item, cnt) in top]
+
+    def report(self, k: int) -> dict:
+        """
+        Describe how much the top :param k: items may differ from the exact top-k:
+            - guaranteed: the number of items certainly part of the exact top-k, i.e. their lower bound
+              is higher than the upper bound of any item outside the estimated top-k;
+            - max_error: the maximal overestimation among the top-k items;
+            - floor: the maximal count of an item not tracked anymore.
+        """
+        top = sorted(self.counts.values(), reverse=True)
+        threshold = max(top[k] if len(top) > k else 0, self.floor)
+        top_k = self.most_common(k)
+        return dict(
+            k=len(top_k),
+            capacity=self.capacity,
+            total=self.total,
+            floor=self.floor,
+            max_error=max((e for (_, _, e) in top_k), default=0),
+            guaranteed=sum(1 for (_, c, e) in top_k if c - e >= threshold))
@@ -1,40 +1,189 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, TfidfTransformer
+from scipy.sparse import vstack, csr_matrix
+from itertools import chain
+from numbers import Integral
 import numpy as np
+from .parallel import map_chunks, effective_n_jobs
+from .sanitization_cache import sanitizer_key, is_persistent, content_hash
+
+# TfidfVectorizer options only used to select and weight the ngrams, not to extract them
+_selection_options = {'ngram_range', 'max_features', 'min_df', 'max_df', 'binary', 'dtype',
+                      'norm', 'use_idf', 'smooth_idf', 'sublinear_tf', 'vocabulary'}
 
 class WrappedVectorizer:
 
-    def __init__(self, sanitizer=None, sg_only=False,  *args, **kwargs):
+    def __init__(self, sanitizer=None, sg_only=False,  *args, n_jobs=1, chunk_size=10000, cache=None,
+                 ngram_cache=None, **kwargs):
+        """
+        :param n_jobs: the number of processes used to sanitize (fit) and to sanitize and transform
+            (transform) the data, in chunks of :param chunk_size: samples.
+        :param cache: an optional SanitizationCache, so that the same data (e.g. the folds of a grid
+            search) is sanitized (and filtered with sg_only) only once.
+        :param ngram_cache: an optional NgramCountCache, so that the vocabulary and the document-term
+            matrix are derived from ngram counts computed once per dataset and ngram order, whatever
+            the ngram_range, max_features, min_df, max_df and weighting options (word and char
+            analyzers only, ignored otherwise).
+        """
         self.sg_only = sg_only 
         self.sanitizer = sanitizer
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.ngram_cache = ngram_cache
         self.vectorizer = TfidfVectorizer(*args, **kwargs)
     
 
-    def fit(self, data, labels=None):
-        if self.sg_only:
-            if labels is None: 
-                raise Exception('fit: Labels cannot be None if sg_only=True')
-            else:  
-                data = np.array(data)[np.array(labels) == 4]
-                # print("fitting using %d data" % len(data))
-        if self.sanitizer is not None:
-            data = self.sanitizer(data)
+    def fit(self, data, labels=None, n_jobs=None, chunk_size=None):
+        if self.sg_only and labels is None:
+            raise Exception('fit: Labels cannot be None if sg_only=True')
+        if self._use_cache():
+            data = self._cached(data, labels if self.sg_only else None,
+                                lambda: self._prepare(data, labels, n_jobs, chunk_size))
+        else:
+            data = self._prepare(data, labels, n_jobs, chunk_size)
         
-        self.vectorizer.fit(data)
+        if self._use_ngram_cache():
+            self._fit_counts(data)
+        else:
+            self.vectorizer.fit(data)
     
 
-    def transform(self, data):
+    def transform(self, data, n_jobs=None, chunk_size=None):
+        n_jobs, chunk_size = self._parallel_options(n_jobs, chunk_size)
+        if self._use_cache() and self.sanitizer is not None:
+            # the data is sanitized (or fetched from the cache) here, only the vectorizer is left
+            data = self._cached(data, None, lambda: self._sanitize_all(data, n_jobs, chunk_size))
+        elif self._use_ngram_cache():
+            data = self._sanitize_all(data, n_jobs, chunk_size)
+        else:
+            return self._map_blocks(self, '_transform', data, n_jobs, chunk_size)
+        if self._use_ngram_cache():
+            return self._transform_counts(data)
+        return self._map_blocks(self.vectorizer, 'transform', data, n_jobs, chunk_size)
+    
+
+    def fit_transform(self, data, labels, n_jobs=None, chunk_size=None):
+        self.fit(data, labels, n_jobs=n_jobs, chunk_size=chunk_size)
+        return self.transform(data, n_jobs=n_jobs, chunk_size=chunk_size)
+
+
+    def _prepare(self, data, labels, n_jobs, chunk_size):
+        # the training data: only the Swiss German samples if sg_only, sanitized
+        if self.sg_only:
+            data = np.array(data)[np.array(labels) == 4]
+            # print("fitting using %d data" % len(data))
+        return self._sanitize_all(data, n_jobs, chunk_size)
+
+
+    def _sanitize_all(self, data, n_jobs, chunk_size):
+        if self.sanitizer is None:
+            return data
+        n_jobs, chunk_size = self._parallel_options(n_jobs, chunk_size)
+        if n_jobs > 1:
+            # the TfidfVectorizer is fitted in this process, only the sanitization is parallel
+            return list(chain.from_iterable(map_chunks(self, '_sanitize', data, n_jobs, chunk_size)))
+        return self.sanitizer(data)
+
+
+    def _use_cache(self):
+        # without sanitizer nor sg_only, the data is used as is: nothing to cache
+        return getattr(self, 'cache', None) is not None and (self.sanitizer is not None or self.sg_only)
+
+
+    def _cached(self, data, labels, compute):
+        key = "%s|%s|%s" % (sanitizer_key(self.sanitizer), labels is not None, content_hash(data, labels))
+        return self.cache.get(key, lambda: list(compute()), persistent=is_persistent(self.sanitizer))
+
+
+    def _use_ngram_cache(self):
+        # char_wb yields the short (padded) words at several orders: its counts cannot be split by order
+        v = self.vectorizer
+        return getattr(self, 'ngram_cache', None) is not None and v.analyzer in ('word', 'char') \
+            and v.vocabulary is None and v.input == 'content'
+
+
+    def _counts(self, data):
+        # the counts of the ngrams of data in the vectorizer ngram_range, see NgramCountCache
+        options = dict((k, v) for (k, v) in self.vectorizer.get_params().items() if k not in _selection_options)
+        key = "TfidfVectorizer(%r)" % sorted(options.items())
+        analyzer = lambda n: TfidfVectorizer(**dict(options, ngram_range=(n, n))).build_analyzer()
+        return self.ngram_cache.counts(key, data, self.vectorizer.ngram_range, analyzer)
+
+
+    def _fit_counts(self, data):
+        # same as TfidfVectorizer.fit, the ngrams being already counted
+        v = self.vectorizer
+        (terms, X) = self._counts(data)
+        if v.binary:
+            X = X.copy()
+            X.data.fill(1)
+
+        n_doc = X.shape[0]
+        max_doc_count = v.max_df if isinstance(v.max_df, Integral) else v.max_df * n_doc
+        min_doc_count = v.min_df if isinstance(v.min_df, Integral) else v.min_df * n_doc
+        if max_doc_count < min_doc_count:
+            raise ValueError("max_df corresponds to < documents than min_df")
+        dfs = np.bincount(X.indices, minlength=X.shape[1])
+        mask = (dfs <= max_doc_count) & (dfs >= min_doc_count)
+        if v.max_features is not None and mask.sum() > v.max_features:
+            # same tie-breaking as sklearn: argsort of the frequencies of the terms sorted alphabetically
+            tfs = np.asarray(X.sum(axis=0)).ravel()
+            mask_inds = (-tfs[mask]).argsort()[:v.max_features]
+            new_mask = np.zeros(len(dfs), dtype=bool)
+            new_mask[np.where(mask)[0][mask_inds]] = True
+            mask = new_mask
+        kept = np.flatnonzero(mask)
+        if kept.size == 0:
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+        v.vocabulary_ = dict(zip(terms[kept], range(kept.size)))
+        v.fixed_vocabulary_ = False
+        v._tfidf = TfidfTransformer(norm=v.norm, use_idf=v.use_idf, smooth_idf=v.smooth_idf,
+                                    sublinear_tf=v.sublinear_tf).fit(X[:, kept].astype(v.dtype))
+
+
+    def _transform_counts(self, data):
+        # same as TfidfVectorizer.transform, the ngrams being already counted
+        v = self.vectorizer
+        (terms, X) = self._counts(data)
+        cols = np.fromiter((v.vocabulary_.get(t, -1) for t in terms), dtype=np.int64, count=terms.size)
+        found = np.flatnonzero(cols >= 0)
+        X = X[:, found]
+        X = csr_matrix((X.data, cols[found][X.indices], X.indptr), shape=(X.shape[0], len(v.vocabulary_)),
+                       dtype=v.dtype)
+        X.sort_indices()
+        if v.binary:
+            X.data.fill(1)
+        return v._tfidf.transform(X, copy=False)
+
+
+    @staticmethod
+    def _map_blocks(obj, method, data, n_jobs, chunk_size):
+        if n_jobs > 1:
+            blocks = map_chunks(obj, method, data, n_jobs, chunk_size)
+            if len(blocks) > 0:
+                return vstack(blocks, format='csr')
+        return getattr(obj, method)(data)
+
+
+    def _sanitize(self, data):
+        return list(self.sanitizer(data))
+
+
+    def _transform(self, data):
         if self.sanitizer is not None: data = self.sanitizer(data)
         return self.vectorizer.transform(data)
-    
 
-    def fit_transform(self, data, labels):
-        self.fit(data, labels)
-        return self.transform(data)
+
+    def _parallel_options(self, n_jobs, chunk_size):
+        n_jobs = getattr(self, 'n_jobs', 1) if n_jobs is None else n_jobs
+        chunk_size = getattr(self, 'chunk_size', 10000) if chunk_size is None else chunk_size
+        return effective_n_jobs(n_jobs), chunk_size
     
 
     def set_params(self, **parameters):
         # treat our params
-        for key in ['sg_only', 'sanitizer']:
+        for key in ['sg_only', 'sanitizer', 'n_jobs', 'chunk_size', 'cache', 'ngram_cache']:
             if key in parameters:
                 setattr(self, key, parameters[key])
                 del parameters[key]
@@ -46,10 +195,13 @@ class WrappedVectorizer:
     
 
     def get_params(self, deep=True):
+        params = dict(sg_only=self.sg_only, sanitizer=self.sanitizer,
+                      n_jobs=getattr(self, 'n_jobs', 1), chunk_size=getattr(self, 'chunk_size', 10000),
+                      cache=getattr(self, 'cache', None), ngram_cache=getattr(self, 'ngram_cache', None))
         if deep:
-            return dict(**dict(sg_only=self.sg_only, sanitizer=self.sanitizer), **self.vectorizer.get_params())
+            return dict(**params, **self.vectorizer.get_params())
         else:
-            return dict(sg_only=self.sg_only, sanitizer=self.sanitizer)
+            return params
 
 
     def __repr__(self):
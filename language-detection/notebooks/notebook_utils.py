@@ -13,6 +13,8 @@ from sklearn import metrics
 
 from typing import List
 
+from langid.corpus_store import build_corpus, load_corpus, is_stale
+
 # ==========================
 #  set big fonts in plots
 # ==========================
@@ -29,30 +31,48 @@ from typing import List
 _datadir = "../data"
 langs = ['de', 'fr', 'en', 'it', 'sg']
 
-def load_data():
+def load_data(lazy=False):
     """
     Load the data from disk.
+    :param lazy: if set, X is a lazy view of the sentences (see langid.corpus_store), backed by
+        a memory-mapped store created from the text files on first use (data/train.corpus).
+        Otherwise (default), X is a numpy array of strings. The view is not an array: use
+        np.asarray(X) for the numpy methods (tolist, size...).
     :return (X, y)
     """
+    fpaths = [os.path.join(_datadir, '%s.txt' % lang) for lang in langs]
+    if lazy:
+        store = os.path.join(_datadir, 'train.corpus')
+        if is_stale(store, fpaths):
+            build_corpus(fpaths, range(len(langs)), store)
+        return load_corpus(store)
+
     X = []
     y = []
     
     for i in range(len(langs)):
-        fpath = os.path.join(_datadir, '%s.txt' % langs[i])
-        lines = [ line.strip() for line in io.open(fpath, encoding="utf-8") ]
+        lines = [ line.strip() for line in io.open(fpaths[i], encoding="utf-8") ]
         X += lines
         y += [i] * len(lines)
 
     return (np.array(X), np.array(y))
 
 
-def load_split_data(test_size=0.2, random_state=0, **kwargs):
+def load_split_data(test_size=0.2, random_state=0, lazy=False, **kwargs):
     """ 
     Load and split data into train and test set.
+    When :param lazy: is set, the split is done on the indices: the train and test sets are views
+    of the store, no sentence is copied.
     Usage: 
        X_train, X_test, y_train, y_test = load_split_data()
+       X_train, X_test, y_train, y_test = load_split_data(lazy=True)  # large corpora
     """
-    (X,y) = load_data()
+    (X,y) = load_data(lazy)
+    if lazy:
+        # same split as with X itself: train_test_split only shuffles the indices
+        (idx_train, idx_test, y_train, y_test) = model_selection.train_test_split(
+            np.arange(len(y)), y, test_size=test_size, random_state=random_state, **kwargs)
+        return X[idx_train], X[idx_test], y_train, y_test
     return model_selection.train_test_split(X, y, test_size=test_size, random_state=random_state, **kwargs)
 
 